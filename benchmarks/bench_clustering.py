@@ -0,0 +1,74 @@
+"""Compare memory and time of dense and sparse clustering of video tags
+
+Usage:
+    python -m benchmarks.bench_clustering --rows 1000 --rows 10000 --rows 100000
+"""
+
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+import click
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from benchmarks.synthetic import generate_tags
+from core.analyze import MAX_FEATURES, _fit_clusters
+
+
+def _measure(func: Callable) -> Tuple[float, float]:
+    """Return elapsed seconds and peak traced memory in MBs"""
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def _dense(word_matrix, n_clusters: int):
+    kmeans = KMeans(n_clusters=n_clusters, max_iter=1000, n_init=1)
+    kmeans.fit(word_matrix.toarray())
+
+
+def _sparse(word_matrix, n_clusters: int):
+    _fit_clusters(word_matrix, n_clusters=n_clusters)
+
+
+@click.command()
+@click.option("--rows", "-r", multiple=True, type=int, default=[1000, 5000, 20000])
+@click.option("--max-features", default=MAX_FEATURES, show_default=True)
+@click.option("--n-clusters", default=4, show_default=True)
+@click.option(
+    "--dense-limit",
+    default=2048,
+    show_default=True,
+    help="Skip dense clustering when the dense matrix needs more MBs",
+)
+def main(rows, max_features, n_clusters, dense_limit):
+    for n_videos in rows:
+        tags = generate_tags(n_videos)
+        vectorizer = TfidfVectorizer(
+            analyzer="word", ngram_range=(1, 2), max_features=max_features
+        )
+        word_matrix = vectorizer.fit_transform(tags["snippet.tags"])
+        n_rows, n_terms = word_matrix.shape
+
+        results = {"sparse": _measure(lambda: _sparse(word_matrix, n_clusters))}
+
+        dense_size = n_rows * n_terms * 8 / 1024 / 1024
+        if dense_size <= dense_limit:
+            results["dense"] = _measure(lambda: _dense(word_matrix, n_clusters))
+
+        for path, (elapsed, peak) in results.items():
+            click.echo(
+                f"videos={n_videos:<8} rows={n_rows:<9} terms={n_terms:<6} "
+                f"path={path:<6} elapsed={elapsed:.2f}s peak={peak:.1f}MB"
+            )
+        if "dense" not in results:
+            click.echo(f"  dense skipped, matrix would need {dense_size:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark throughput of the concurrent fetch engine against the local stub server
+
+Usage:
+    python -m benchmarks.bench_fetch --total-results 2000 --latency 0.05
+"""
+
+import os
+import time
+
+import click
+
+from benchmarks.youtube_stub import StubServer
+from core import youtube_api
+from core.fetcher import fetch_video_details_concurrently
+
+
+@click.command()
+@click.option("--total-results", default=1000, show_default=True)
+@click.option("--latency", default=0.05, show_default=True, help="Seconds per request")
+@click.option("--error-rate", default=0.0, show_default=True)
+@click.option("--workers", "-w", multiple=True, type=int, default=[1, 2, 4, 8])
+def main(total_results, latency, error_rate, workers):
+    server = StubServer(
+        total_results=total_results, latency=latency, error_rate=error_rate
+    )
+    server.start()
+
+    os.environ["YOUTUBE_API_ENDPOINT"] = server.endpoint
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    youtube_api.configure(max_retries=8)
+
+    for n_workers in workers:
+        server.requests.clear()
+        started_at = time.perf_counter()
+
+        search_pages = youtube_api.search(
+            keyword="python", max_results=total_results, max_per_request=50
+        )
+        n_videos = sum(
+            len(video_details["items"])
+            for _, video_details in fetch_video_details_concurrently(
+                search_pages, workers=n_workers
+            )
+        )
+
+        elapsed = time.perf_counter() - started_at
+        click.echo(
+            f"workers={n_workers:<3} videos={n_videos:<7} "
+            f"elapsed={elapsed:.2f}s throughput={n_videos / elapsed:.1f} videos/s "
+            f"requests={server.requests}"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Benchmark of every stage of the pipeline on synthetic data
+
+Synthetic `videos.list` items are written as raw chunks and then preprocessed,
+categorized, loaded and used to compute every metric, the same way `preprocess`
+and `metrics` commands do. Time and peak memory of each stage is stored as JSON,
+so that results can be compared between commits. Runs fully offline.
+
+Stages write to `/tmp/aviyel__preprocessed`, `/tmp/aviyel__datalake` and
+`/tmp/aviyel__model`, hence they must not exist before running it
+
+Usage:
+    python -m benchmarks.bench_pipeline --videos 10000 --videos 100000
+    python -m benchmarks.bench_pipeline --videos 10000 --compare baseline.json
+"""
+
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+import orjson
+
+from benchmarks.synthetic import generate_video_details
+from core import analyze
+from core.io import DataType, add_delete_marker, dump, load_file, load_processed_data
+
+# Number of videos in a single raw chunk, same as `raw` stores
+CHUNK_SIZE = 50
+
+# Data written by the stages
+DATA_TYPES = [DataType.PREPROCESSED, DataType.DATA_LAKE, DataType.MODEL]
+
+# Columns loaded to benchmark `load_processed_data`, same as all metrics need
+LOAD_COLUMNS = ["id", "snippet.tags", "duration", "category", "statistics.viewCount"]
+
+
+def _max_rss() -> float:
+    """Return peak resident memory of the process in MBs"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Recorder:
+    """Measure stages and collect their results"""
+
+    def __init__(self, n_videos: int, trace_memory: bool = True):
+        self.n_videos = n_videos
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(
+        self, func: Callable, *args, **kwargs
+    ) -> Tuple[Any, float, Optional[float]]:
+        """Return result, elapsed seconds and peak traced memory in MBs"""
+        if self.trace_memory:
+            tracemalloc.start()
+        started_at = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started_at
+
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        return result, elapsed, peak
+
+    def measure(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        result, elapsed, peak = self.run(func, *args, **kwargs)
+        self.add(stage, elapsed, peak)
+        return result
+
+    def add(self, stage: str, seconds: float, peak_memory_mb: Optional[float]):
+        result = {
+            "stage": stage,
+            "videos": self.n_videos,
+            "seconds": round(seconds, 4),
+            "peak_memory_mb": (
+                round(peak_memory_mb, 2) if peak_memory_mb is not None else None
+            ),
+            "max_rss_mb": round(_max_rss(), 2),
+        }
+        self.results.append(result)
+        click.echo(
+            f"videos={self.n_videos:<9} {stage:<40} {seconds:>9.3f}s "
+            f"peak={result['peak_memory_mb'] or '-':>9}MB "
+            f"rss={result['max_rss_mb']:>9}MB"
+        )
+
+
+def _write_chunks(directory: str, n_videos: int, mean_tags: float) -> List[str]:
+    paths = []
+    for idx, offset in enumerate(range(0, n_videos, CHUNK_SIZE)):
+        items = generate_video_details(
+            min(CHUNK_SIZE, n_videos - offset),
+            seed=idx,
+            offset=offset,
+            mean_tags=mean_tags,
+        )
+        path = os.path.join(directory, f"chunk{idx:08d}.ndjson")
+        with open(path, "wb") as f:
+            f.write(b"".join(orjson.dumps(item) + b"\n" for item in items))
+        paths.append(path)
+    return paths
+
+
+def _preprocess(recorder: Recorder, paths: List[str]):
+    """Clean up and dump chunks, measured separately and summed up over chunks"""
+    totals = {"cleanup_video_data": [0.0, None], "dump_preprocessed": [0.0, None]}
+
+    def _add(stage: str, elapsed: float, peak: Optional[float]):
+        totals[stage][0] += elapsed
+        if peak is not None:
+            totals[stage][1] = max(totals[stage][1] or 0.0, peak)
+
+    for path in paths:
+        data = load_file(path, as_dataframe=True)
+        tables, elapsed, peak = recorder.run(analyze.cleanup_video_data, data)
+        _add("cleanup_video_data", elapsed, peak)
+        _, elapsed, peak = recorder.run(
+            dump, data=tables, data_type=DataType.PREPROCESSED
+        )
+        _add("dump_preprocessed", elapsed, peak)
+
+    for stage, (elapsed, peak) in totals.items():
+        recorder.add(stage, elapsed, peak)
+
+
+def _categorize():
+    tables = analyze.categorize_videos()
+    dump(data=tables, data_type=DataType.DATA_LAKE)
+
+
+def _compute_functions() -> Dict[str, Callable]:
+    return {
+        name: getattr(analyze, name)
+        for name in analyze.__all__
+        if name.startswith("compute_") and name != "compute_metrics"
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {
+            (result["stage"], result["videos"]): result
+            for result in json.load(f)["results"]
+        }
+
+    click.echo(f"\nCompared to {baseline_path}")
+    for result in results:
+        previous = baseline.get((result["stage"], result["videos"]))
+        if not previous or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        click.echo(
+            f"videos={result['videos']:<9} {result['stage']:<40} "
+            f"{previous['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s "
+            f"({ratio:.2f}x)"
+        )
+
+
+@click.command()
+@click.option("--videos", "-n", multiple=True, type=int, default=[10000])
+@click.option("--mean-tags", default=8.0, show_default=True, type=float)
+@click.option(
+    "--memory/--no-memory",
+    default=True,
+    show_default=True,
+    help="Trace peak memory of stages, which slows them down",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Path of JSON results, defaults to /tmp/aviyel_bench__<commit>.json",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="JSON results of an earlier run to compare with",
+)
+def main(videos, mean_tags, memory, output, compare):
+    for data_type in DATA_TYPES:
+        path = os.path.join("/tmp", f"aviyel__{data_type.value}")
+        if os.path.exists(path):
+            raise click.ClickException(f"Remove {path} before benchmarking")
+
+    results = []
+    for n_videos in videos:
+        recorder = Recorder(n_videos, trace_memory=memory)
+        directory = tempfile.mkdtemp(prefix="bench_pipeline__")
+        try:
+            paths = recorder.measure(
+                "generate_raw", _write_chunks, directory, n_videos, mean_tags
+            )
+            _preprocess(recorder, paths)
+            recorder.measure("categorize_videos", _categorize)
+            recorder.measure("load_processed_data", load_processed_data, LOAD_COLUMNS)
+            for name, func in _compute_functions().items():
+                recorder.measure(name, func)
+        finally:
+            shutil.rmtree(directory)
+            for data_type in DATA_TYPES:
+                add_delete_marker(data_type=data_type)
+        results.extend(recorder.results)
+
+    commit = _git_commit()
+    output = output or f"/tmp/aviyel_bench__{commit or 'unknown'}.json"
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "params": {"mean_tags": mean_tags, "trace_memory": memory},
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    click.echo(f"Stored results at {output}")
+
+    if compare:
+        _compare(results, compare)
+
+
+if __name__ == "__main__":
+    main()
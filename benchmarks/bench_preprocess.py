@@ -0,0 +1,85 @@
+"""Benchmark of preprocessing raw chunks using multiple worker processes
+
+Writes synthetic chunks of raw video details to a temporary directory and
+preprocesses all of them with increasing number of workers. Preprocessed data is
+written to `/tmp/aviyel__preprocessed`, hence it must not exist before running it
+
+Usage:
+    python -m benchmarks.bench_preprocess --chunks 200 --workers 1 --workers 4
+    python -m benchmarks.bench_preprocess --chunks 200 --workers 1 --raw-format json
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+import click
+
+from benchmarks.synthetic import generate_video_details
+from core.io import DataType, add_delete_marker
+from core.preprocessor import preprocess_concurrently
+
+# Number of videos in a single raw chunk, same as `raw` stores
+CHUNK_SIZE = 50
+
+
+def _write_chunks(directory: str, n_chunks: int, raw_format: str) -> List[str]:
+    items = generate_video_details(n_chunks * CHUNK_SIZE)
+    paths = []
+    for idx in range(n_chunks):
+        chunk = items[idx * CHUNK_SIZE : (idx + 1) * CHUNK_SIZE]
+        path = os.path.join(directory, f"chunk{idx:06d}.{raw_format}")
+        with open(path, "w") as f:
+            if raw_format == "ndjson":
+                f.writelines(f"{json.dumps(item)}\n" for item in chunk)
+            else:
+                json.dump([{"kind": "youtube#videoListResponse", "items": chunk}], f)
+        paths.append(path)
+    return paths
+
+
+@click.command()
+@click.option("--chunks", default=200, show_default=True, type=int)
+@click.option("--workers", "-w", multiple=True, type=int, default=[1, 2, 4])
+@click.option(
+    "--raw-format",
+    type=click.Choice(["ndjson", "json"]),
+    default="ndjson",
+    show_default=True,
+)
+def main(chunks, workers, raw_format):
+    preprocessed = os.path.join("/tmp", f"aviyel__{DataType.PREPROCESSED.value}")
+    if os.path.exists(preprocessed):
+        raise click.ClickException(f"Remove {preprocessed} before benchmarking")
+
+    directory = tempfile.mkdtemp(prefix="bench_preprocess__")
+    try:
+        paths = _write_chunks(directory, chunks, raw_format)
+
+        baseline = None
+        for n_workers in workers:
+            started_at = time.perf_counter()
+            errors = [
+                error
+                for _, error in preprocess_concurrently(paths, workers=n_workers)
+                if error
+            ]
+            elapsed = time.perf_counter() - started_at
+            add_delete_marker(data_type=DataType.PREPROCESSED)
+
+            assert not errors, f"Failed to preprocess chunks: {errors[0]!r}"
+            baseline = baseline or elapsed
+            click.echo(
+                f"format={raw_format:<7} workers={n_workers:<3} chunks={chunks:<6} "
+                f"elapsed={elapsed:.2f}s "
+                f"chunks/s={chunks / elapsed:.1f} speedup={baseline / elapsed:.2f}x"
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
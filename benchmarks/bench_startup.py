@@ -0,0 +1,225 @@
+"""Check import time of CLI commands against their budgets
+
+Modules imported by each command are read from the source of `main.py`, i.e
+imports of the command, of its group and of the functions of `main.py` they call.
+Each command is measured in a new interpreter started with `-X importtime`, which
+imports `main` along with these modules, hence any import added to them or to the
+modules they import is measured. Import time of a command is the least of
+multiple runs. Exits with non-zero status when a command exceeds its budget or
+imports a heavy module it does not need, the same checks are run by
+`tests/test_startup.py`
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 10 --scale 2
+"""
+
+import ast
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+import click
+
+# Heavy dependencies which must be imported only by commands using them
+HEAVY_MODULES = [
+    "pandas",
+    "pyarrow",
+    "scipy",
+    "joblib",
+    "sklearn",
+    "gensim",
+    "googleapiclient",
+]
+
+# Budget of import time (in ms) of each command and heavy modules it must not
+# import. Budgets are about twice of import time measured on a single core
+COMMANDS = {
+    "--help": (250, HEAVY_MODULES),
+    "raw": (1200, ["scipy", "joblib", "sklearn", "gensim"]),
+    "preprocess": (1200, ["sklearn", "gensim", "googleapiclient"]),
+    "retrain": (1200, ["sklearn", "gensim", "googleapiclient"]),
+    "compact": (1000, ["scipy", "joblib", "sklearn", "gensim", "googleapiclient"]),
+    "metrics": (1200, ["scipy", "joblib", "sklearn", "gensim", "googleapiclient"]),
+    "run": (1200, ["scipy", "joblib", "sklearn", "gensim"]),
+}
+
+# Line of `-X importtime` output i.e self and cumulative time in us and module
+# name, indented by its depth in the import tree
+IMPORT_TIME = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _command_name(decorator: ast.expr) -> Tuple[str, str]:
+    """Return group and command name of `@<group>.command(...)` or `.group(...)`"""
+    if not (
+        isinstance(decorator, ast.Call)
+        and isinstance(decorator.func, ast.Attribute)
+        and decorator.func.attr in ["command", "group"]
+        and isinstance(decorator.func.value, ast.Name)
+    ):
+        return "", ""
+    name = ""
+    for keyword in decorator.keywords:
+        if keyword.arg == "name":
+            try:
+                name = ast.literal_eval(keyword.value)
+            except ValueError:
+                # Name is computed e.g by a function creating commands
+                pass
+    return decorator.func.value.id, name
+
+
+def command_modules(source: str) -> Dict[str, List[str]]:
+    """Return modules imported by each command of the CLI defined in the source
+
+    Commands of a group e.g `metrics` are measured as a whole, with imports of the
+    group and all of its commands
+    """
+    tree = ast.parse(source)
+    functions = {
+        node.name: node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)
+    }
+
+    # Functions of the source called by a function are followed, each of them once
+    def _imports(function: ast.FunctionDef, seen: Set[str]) -> Set[str]:
+        seen.add(function.name)
+        modules = set()
+        for child in ast.walk(function):
+            if isinstance(child, ast.Import):
+                modules.update(alias.name for alias in child.names)
+            elif isinstance(child, ast.ImportFrom) and child.module:
+                modules.add(child.module)
+            elif (
+                isinstance(child, ast.Name)
+                and child.id in functions
+                and child.id not in seen
+            ):
+                modules |= _imports(functions[child.id], seen)
+        return modules
+
+    # Group and name of every command, root group runs for every command
+    commands = {}
+    root = None
+    for function in functions.values():
+        for decorator in function.decorator_list:
+            group, name = _command_name(decorator)
+            if group == "click":
+                root = function.name
+            elif group:
+                commands[function.name] = (
+                    group,
+                    name or function.name.replace("_", "-"),
+                )
+
+    # Commands created by calling the decorator e.g `metrics.command(name=...)(f)`
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and node.args
+            and isinstance(node.args[0], ast.Name)
+            and node.args[0].id in functions
+        ):
+            group, name = _command_name(node.func)
+            if group and group != "click":
+                commands[node.args[0].id] = (group, name or node.args[0].id)
+
+    modules_by_command = {}
+    for function_name, (group, name) in commands.items():
+        if group != root:
+            continue
+        members = [function_name] + [
+            member
+            for member, (member_group, _) in commands.items()
+            if member_group == function_name
+        ]
+        modules, seen = set(), set()
+        for member in [root, *members]:
+            modules |= _imports(functions[member], seen)
+        modules_by_command[name] = sorted(modules)
+    return modules_by_command
+
+
+def main_commands() -> Dict[str, List[str]]:
+    """Return modules imported by each command of `main.py`, `--help` imports none"""
+    with open(os.path.join(ROOT_DIR, "main.py")) as f:
+        commands = command_modules(f.read())
+    return {"--help": [], **commands}
+
+
+def measure(modules: List[str], forbidden: List[str]) -> Tuple[float, List[str]]:
+    """Return import time (in ms) of `main` and modules and forbidden modules imported"""
+    code = (
+        f"import sys, {', '.join(['main', *modules])}\n"
+        f"print(','.join(m for m in {forbidden!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Cumulative time of top level imports covers all nested imports
+    total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match and not match.group(2):
+            total += int(match.group(1))
+    imported = [name for name in result.stdout.strip().split(",") if name]
+    return total / 1000, imported
+
+
+def check(command: str, modules: List[str], repeat: int, scale: float) -> Dict:
+    """Measure a command and return its import time, budget and status"""
+    budget, forbidden = COMMANDS[command]
+    runs = [measure(modules, forbidden) for _ in range(repeat)]
+    elapsed = min(elapsed for elapsed, _ in runs)
+    imported = runs[0][1]
+
+    budget *= scale
+    status = "ok"
+    if imported:
+        status = f"imports {', '.join(imported)}"
+    elif elapsed > budget:
+        status = "over budget"
+    return {"elapsed": elapsed, "budget": budget, "status": status}
+
+
+@click.command()
+@click.option("--repeat", default=5, show_default=True, type=click.IntRange(min=1))
+@click.option(
+    "--scale",
+    default=1.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Multiply budgets e.g on slower machines",
+)
+def main(repeat, scale):
+    failures: Dict[str, str] = {}
+    for command, modules in main_commands().items():
+        if command not in COMMANDS:
+            failures[command] = "no budget"
+            click.echo(f"{command:<12} no budget")
+            continue
+
+        result = check(command, modules, repeat, scale)
+        if result["status"] != "ok":
+            failures[command] = result["status"]
+        click.echo(
+            f"{command:<12} {result['elapsed']:>9.1f}ms "
+            f"budget={result['budget']:>7.0f}ms {result['status']}"
+        )
+
+    if failures:
+        raise click.ClickException(
+            f"Startup of {len(failures)} commands regressed: {', '.join(failures)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
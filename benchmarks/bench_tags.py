@@ -0,0 +1,84 @@
+"""Microbenchmark of tag normalization used to categorize videos
+
+Compares the per row implementation used earlier with the current one which
+normalizes each distinct word only once
+
+Usage:
+    python -m benchmarks.bench_tags --videos 10000 --videos 100000
+"""
+
+import re
+import string
+import time
+from typing import Tuple
+
+import click
+import numpy as np
+import pandas as pd
+from gensim.parsing.porter import PorterStemmer
+from gensim.parsing.preprocessing import remove_stopwords
+
+from benchmarks.synthetic import generate_tags
+from core.analyze import ENGLISH_LETTERS, _normalize_tags, _normalize_word
+
+
+def _legacy_normalize_tags(df: pd.DataFrame) -> pd.DataFrame:
+    def _preprocess_text(text: str) -> str:
+        return (
+            text.translate(str.maketrans("", "", string.punctuation))
+            .translate(str.maketrans("", "", string.digits))
+            .lower()
+        )
+
+    cdf = df[["id", "snippet.tags"]].copy()
+    cdf.loc[:, "processedTag"] = cdf["snippet.tags"].map(lambda x: x.split(" "))
+    cdf = cdf.explode("processedTag")
+
+    isEng = lambda x: re.sub(ENGLISH_LETTERS, "", x)
+    cdf["processedTag"] = np.vectorize(isEng)(cdf["processedTag"])
+    cdf.loc[:, "processedTag"] = (
+        cdf["processedTag"].map(_preprocess_text).map(remove_stopwords)
+    )
+    cdf = cdf[cdf["processedTag"] != ""]
+    cdf = cdf[cdf["processedTag"] != "python"]
+
+    def _stemmer(text: str) -> str:
+        stemmer = PorterStemmer()
+        return stemmer.stem_sentence(text)
+
+    cdf.loc[:, "stemmedTag"] = cdf.apply(lambda x: _stemmer(x["processedTag"]), axis=1)
+    return cdf.drop_duplicates(subset=["id", "stemmedTag"]).reset_index(drop=True)
+
+
+def _timeit(func, *args) -> Tuple[float, pd.DataFrame]:
+    started_at = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started_at, result
+
+
+@click.command()
+@click.option("--videos", "-n", multiple=True, type=int, default=[1000, 10000])
+def main(videos):
+    for n_videos in videos:
+        tags = generate_tags(n_videos)
+        words = tags["snippet.tags"].str.split(" ").explode()
+
+        legacy_elapsed, expected = _timeit(_legacy_normalize_tags, tags)
+
+        _normalize_word.cache_clear()
+        cold_elapsed, result = _timeit(_normalize_tags, tags)
+        warm_elapsed, _ = _timeit(_normalize_tags, tags)
+
+        columns = ["id", "processedTag", "stemmedTag"]
+        assert expected[columns].equals(result[columns]), "Results do not match"
+
+        click.echo(
+            f"videos={n_videos:<8} words={len(words):<9} "
+            f"distinct={words.nunique():<7} legacy={legacy_elapsed:.2f}s "
+            f"cold={cold_elapsed:.2f}s warm={warm_elapsed:.2f}s "
+            f"speedup={legacy_elapsed / cold_elapsed:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
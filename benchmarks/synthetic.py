@@ -0,0 +1,167 @@
+"""Generators of synthetic data shaped like YT Data API responses"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Vocabulary used to build tags. Words are drawn with a Zipf-like distribution so
+# that few tags are very common and most of them are rare, like real tags
+WORDS = [
+    "python", "tutorial", "django", "flask", "pandas", "numpy", "machine",
+    "learning", "data", "science", "web", "api", "beginner", "course", "async",
+    "ml", "ai", "game", "pygame", "automation", "selenium", "scraping", "deep",
+    "neural", "network", "tensorflow", "pytorch", "programming", "coding",
+    "interview", "project", "developer", "backend", "fastapi", "sql", "database",
+    "excel", "visualization", "matplotlib", "opencv", "robotics", "raspberry",
+    "pi", "linux", "docker", "kubernetes", "cloud", "aws", "azure", "testing",
+]  # fmt: skip
+
+
+def _zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _video_id(idx: int) -> str:
+    return f"v{idx:010d}"
+
+
+def generate_tags(
+    n_videos: int,
+    mean_tags: float = 8.0,
+    n_words: int = 5000,
+    seed: int = 0,
+    offset: int = 0,
+) -> pd.DataFrame:
+    """Generate `id` and `snippet.tags` columns of the video tags table
+
+    Number of tags per video follows a poisson distribution and every tag has one to
+    three words drawn from a vocabulary of `n_words` words. Videos are numbered
+    starting from `offset`
+    """
+    rng = np.random.default_rng(seed)
+
+    # Extend vocabulary with synthetic words to get a long tail of distinct tags
+    vocabulary = np.array(WORDS + [f"word{idx}" for idx in range(n_words - len(WORDS))])
+    weights = _zipf_weights(len(vocabulary))
+
+    n_tags = rng.poisson(mean_tags, size=n_videos)
+    video_ids = np.repeat(
+        [_video_id(idx) for idx in range(offset, offset + n_videos)], n_tags
+    )
+
+    total = int(n_tags.sum())
+    n_tag_words = rng.integers(1, 4, size=total)
+    words = rng.choice(vocabulary, size=(total, 3), p=weights)
+    tags = [" ".join(row[:length]) for row, length in zip(words, n_tag_words)]
+
+    df = pd.DataFrame({"id": video_ids, "snippet.tags": tags})
+    return df.drop_duplicates().reset_index(drop=True)
+
+
+TOPICS = [
+    "https://en.wikipedia.org/wiki/Technology",
+    "https://en.wikipedia.org/wiki/Knowledge",
+    "https://en.wikipedia.org/wiki/Video_game_culture",
+    "https://en.wikipedia.org/wiki/Hobby",
+    "https://en.wikipedia.org/wiki/Music",
+]
+
+
+def _duration(seconds: int) -> str:
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"PT{hours}H{minutes}M{seconds}S"
+
+
+def generate_video_details(
+    n_videos: int,
+    seed: int = 0,
+    offset: int = 0,
+    mean_tags: float = 8.0,
+    n_words: int = 5000,
+    mean_topics: float = 1.5,
+) -> List[Dict]:
+    """Generate items of `videos.list` response with all parts fetched by `raw`
+
+    Views follow a heavy tailed pareto distribution and few videos hide their likes,
+    like real videos. Number of tags and topics per video follow poisson
+    distributions with given means. Videos are numbered starting from `offset`
+    """
+    rng = np.random.default_rng(seed)
+    tags = generate_tags(
+        n_videos, mean_tags=mean_tags, n_words=n_words, seed=seed, offset=offset
+    )
+    tags = {
+        video_id: list(video_tags)
+        for video_id, video_tags in tags.groupby("id")["snippet.tags"]
+    }
+    topic_weights = _zipf_weights(len(TOPICS))
+
+    items = []
+    for idx in range(offset, offset + n_videos):
+        video_id = _video_id(idx)
+        view_count = int(rng.pareto(1.2) * 1000)
+        title = f"Video {idx}"
+        description = f"Description of video {idx}"
+        snippet = {
+            "publishedAt": f"2021-{rng.integers(1, 13):02d}-01T00:00:00Z",
+            "channelId": f"UC{rng.integers(0, 500):022d}",
+            "title": title,
+            "description": description,
+            "thumbnails": {
+                name: {
+                    "url": f"https://i.ytimg.com/vi/{video_id}/{name}.jpg",
+                    "width": width,
+                    "height": height,
+                }
+                for name, width, height in [
+                    ("default", 120, 90),
+                    ("medium", 320, 180),
+                    ("high", 480, 360),
+                ]
+            },
+            "channelTitle": f"Channel {rng.integers(0, 500)}",
+            "categoryId": str(rng.choice([22, 24, 27, 28])),
+            "liveBroadcastContent": "none",
+            "localized": {"title": title, "description": description},
+            "defaultAudioLanguage": "en",
+        }
+        if video_id in tags:
+            snippet["tags"] = tags[video_id]
+
+        statistics = {
+            "viewCount": str(view_count),
+            "likeCount": str(int(view_count * rng.random() * 0.05)),
+            "dislikeCount": str(int(view_count * rng.random() * 0.005)),
+            "favoriteCount": "0",
+            "commentCount": str(int(view_count * rng.random() * 0.01)),
+        }
+        if rng.random() < 0.05:
+            del statistics["likeCount"]
+
+        item = {
+            "kind": "youtube#video",
+            "etag": f"etag{idx}",
+            "id": video_id,
+            "snippet": snippet,
+            "contentDetails": {
+                "duration": _duration(int(rng.exponential(600))),
+                "dimension": "2d",
+                "definition": str(rng.choice(["hd", "sd"])),
+                "caption": "false",
+                "licensedContent": bool(rng.random() < 0.5),
+                "contentRating": {},
+                "projection": "rectangular",
+            },
+            "statistics": statistics,
+        }
+
+        n_topics = min(rng.poisson(mean_topics), len(TOPICS))
+        if n_topics:
+            topics = rng.choice(TOPICS, size=n_topics, replace=False, p=topic_weights)
+            item["topicDetails"] = {"topicCategories": [str(t) for t in topics]}
+
+        items.append(item)
+    return items
@@ -0,0 +1,186 @@
+"""Local stub HTTP server which mimics `search` and `videos` endpoints of YT Data API
+
+Usage:
+    python -m benchmarks.youtube_stub --port 8080 --latency 0.05
+
+Point the client to it by setting `YOUTUBE_API_ENDPOINT=http://127.0.0.1:8080`
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+
+def _video_item(video_id: str) -> Dict:
+    rnd = random.Random(video_id)
+    return {
+        "kind": "youtube#video",
+        "etag": f"etag-{video_id}",
+        "id": video_id,
+        "snippet": {
+            "title": f"Video {video_id}",
+            "channelTitle": "stub",
+            "tags": [f"tag {rnd.randint(0, 100)}" for _ in range(rnd.randint(0, 10))],
+        },
+        "contentDetails": {"duration": f"PT{rnd.randint(0, 59)}M{rnd.randint(0, 59)}S"},
+        "statistics": {
+            "viewCount": str(rnd.randint(0, 10**6)),
+            "likeCount": str(rnd.randint(0, 10**4)),
+            "favoriteCount": "0",
+            "commentCount": str(rnd.randint(0, 10**3)),
+        },
+        "topicDetails": {
+            "topicCategories": ["https://en.wikipedia.org/wiki/Technology"]
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _search(self, params: Dict) -> Dict:
+        total = self.server.total_results
+        start = int(params.get("pageToken", ["0"])[0])
+        limit = int(params.get("maxResults", ["5"])[0])
+        end = min(start + limit, total)
+        response = {
+            "kind": "youtube#searchListResponse",
+            "pageInfo": {"totalResults": total, "resultsPerPage": limit},
+            "items": [
+                {
+                    "kind": "youtube#searchResult",
+                    "id": {"kind": "youtube#video", "videoId": f"v{idx:010d}"},
+                }
+                for idx in range(start, end)
+            ],
+        }
+        if end < total:
+            response["nextPageToken"] = str(end)
+        return response
+
+    def _videos(self, params: Dict) -> Dict:
+        video_ids = params.get("id", [""])[0].split(",")
+        # Same videos are missing on every request, like deleted or private ones
+        items = [
+            _video_item(video_id)
+            for video_id in video_ids
+            if video_id
+            and random.Random(f"missing-{video_id}").random()
+            >= self.server.missing_rate
+        ]
+        return {
+            "kind": "youtube#videoListResponse",
+            "pageInfo": {"totalResults": len(items), "resultsPerPage": len(items)},
+            "items": items,
+        }
+
+    def _reply(self, status: int, body: Dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        endpoint = url.path.rstrip("/").split("/")[-1]
+        self.server.record(endpoint)
+
+        time.sleep(self.server.latency)
+
+        if random.random() < self.server.drop_rate:
+            # Connection is closed without a response, like a reset keep-alive one
+            self.close_connection = True
+            return
+        if random.random() < self.server.error_rate:
+            status = random.choice([429, 503])
+            self._reply(status, {"error": {"code": status, "message": "stub error"}})
+        elif endpoint == "search":
+            self._reply(200, self._search(params))
+        elif endpoint == "videos":
+            self._reply(200, self._videos(params))
+        else:
+            self._reply(404, {"error": {"code": 404, "message": "not found"}})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        total_results: int = 500,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        missing_rate: float = 0.0,
+    ):
+        super().__init__(address, _Handler)
+        self.total_results = total_results
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.missing_rate = missing_rate
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def start(self) -> Optional[threading.Thread]:
+        """Serve requests in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+@click.command()
+@click.option("--port", default=8080, show_default=True)
+@click.option("--total-results", default=500, show_default=True)
+@click.option("--latency", default=0.0, show_default=True, help="Seconds per request")
+@click.option("--error-rate", default=0.0, show_default=True)
+@click.option(
+    "--drop-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of requests whose connection is closed without a response",
+)
+@click.option(
+    "--missing-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of videos which are never returned by the videos endpoint",
+)
+def main(port, total_results, latency, error_rate, drop_rate, missing_rate):
+    server = StubServer(
+        ("127.0.0.1", port),
+        total_results=total_results,
+        latency=latency,
+        error_rate=error_rate,
+        drop_rate=drop_rate,
+        missing_rate=missing_rate,
+    )
+    click.echo(f"Serving stub YT Data API at {server.endpoint}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,113 @@
 import re
 import string
-from typing import Callable
+from datetime import date
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from gensim.parsing.porter import PorterStemmer
-from gensim.parsing.preprocessing import remove_stopwords
-from sklearn.cluster import KMeans
-from sklearn.feature_extraction.text import TfidfVectorizer
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from core import cache, instrument
+from core.constants import MAX_FEATURES, MIN_DF, N_CLUSTERS
+from core.io import (
+    DataType,
+    Filter,
+    Table,
+    dump_model,
+    load_batches,
+    load_model,
+    load_processed_data,
+)
 
-from core.io import DataType, load_processed_data
+# gensim, scikit-learn, scipy and joblib are imported only by functions
+# categorizing videos, so that computing metrics does not pay for importing them
+if TYPE_CHECKING:
+    from scipy import sparse
+    from sklearn.cluster import MiniBatchKMeans
 
 pd.options.mode.chained_assignment = None
 
 ISO_8601 = re.compile(
-    "P"
-    "(?:T"
-    "(?:(?P<hours>\d+)H)?"
-    "(?:(?P<minutes>\d+)M)?"
-    "(?:(?P<seconds>\d+)S)?"
-    ")?"
+    r"P"
+    r"(?:(?P<weeks>\d+)W)?"
+    r"(?:(?P<days>\d+)D)?"
+    r"(?:T"
+    r"(?:(?P<hours>\d+)H)?"
+    r"(?:(?P<minutes>\d+)M)?"
+    r"(?:(?P<seconds>\d+)S)?"
+    r")?"
 )
 
+# Number of seconds in each component of ISO 8601 duration
+DURATION_UNITS = {
+    "weeks": 7 * 24 * 60 * 60,
+    "days": 24 * 60 * 60,
+    "hours": 60 * 60,
+    "minutes": 60,
+    "seconds": 1,
+}
+
 ENGLISH_LETTERS = re.compile("[^a-zA-Z0-9]+")
 
+# Statistics of videos, stored as nullable unsigned integers
+STATISTICS_COLUMNS = [
+    "statistics.viewCount",
+    "statistics.likeCount",
+    "statistics.dislikeCount",
+    "statistics.favoriteCount",
+    "statistics.commentCount",
+]
+
+# Clusters are fitted incrementally over batches of rows of the word matrix
+CLUSTERING_BATCH_SIZE = 4096
+CLUSTERING_EPOCHS = 10
+
+# Number of clusters evaluated when it is selected automatically. Clusters are
+# evaluated on a sample of rows of the word matrix
+AUTO_CLUSTERS_RANGE = range(2, 13)
+AUTO_CLUSTERS_SAMPLE_SIZE = 10000
+
+# Fixed seed keeps category codes and labels stable across trainings
+RANDOM_STATE = 42
+
+# Maximum number of distinct words of tags whose normalized form is memoized
+TAG_CACHE_SIZE = 2**18
+
+# Name of the persisted model used to categorize videos
+CATEGORY_MODEL = "category_model"
+
+# Columns of videos table assigned by categorization
+CATEGORY_COLUMNS = ["categoryCode", "category"]
+
+# Columns assigned to each table by categorization. Tags and topics are stamped
+# with category of their video, so that filters on it skip their partitions too
+TABLE_CATEGORY_COLUMNS = {
+    Table.VIDEOS: CATEGORY_COLUMNS,
+    Table.VIDEO_TAGS: ["category"],
+    Table.VIDEO_TOPICS: ["category"],
+}
+
 __all__ = [
     "cleanup_video_data",
+    "categorize_videos",
+    "recategorize_videos",
+    "train_category_model",
+    "category_model_params",
+    "select_n_clusters",
+    "required_columns",
+    "apply_aggregate",
+    "derive_metric",
+    "compute_metrics",
     "compute_videos_per_tag",
     "compute_videos_per_category",
     "compute_tag_with_most_videos",
     "compute_category_with_most_videos",
     "compute_tag_with_least_videos",
     "compute_category_with_least_videos",
-    "compute_avg_video_duration_by_tag",
-    "compute_avg_video_duration_by_category",
+    "compute_avg_video_duration_per_tag",
+    "compute_avg_video_duration_per_category",
     "compute_most_video_time_tag",
     "compute_most_video_time_category",
     "compute_least_video_time_tag",
@@ -42,284 +116,748 @@ __all__ = [
 ]
 
 
-def cleanup_video_data(df: pd.DataFrame) -> pd.DataFrame:
-    # Unpack items to have one row for each video
-    df = df.explode("items")
-    df = pd.json_normalize(df["items"])
+def _parse_duration(durations: pd.Series) -> pd.DataFrame:
+    """Parse ISO 8601 durations into its components and total duration in seconds"""
+    df = durations.str.extract(ISO_8601).fillna(0).astype(np.uint64)
+    df.loc[:, "duration"] = sum(
+        df[component] * np.uint64(seconds)
+        for component, seconds in DURATION_UNITS.items()
+    )
+    return df
 
-    # Unpack tags to have one tag for one video in each row
-    df = df.explode("snippet.tags")
 
-    # Unpack topic categories
-    df = df.explode("topicDetails.topicCategories")
+def _flatten(table: pa.Table) -> pa.Table:
+    """Flatten nested structs into columns named like `snippet.title`"""
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    return table
+
+
+def cleanup_video_data(
+    data: Union[pd.DataFrame, pa.Table], ingest_date: Optional[str] = None
+) -> Dict[Table, pd.DataFrame]:
+    """Normalize raw video details into videos, video tags and video topics tables
+
+    Raw data is either API responses or an Arrow table with one row for each video.
+    Rows of all the tables are stamped with the date of ingestion, which defaults to
+    today. Tables are partitioned by it
+    """
+    ingest_date = ingest_date or date.today().isoformat()
+
+    if isinstance(data, pa.Table):
+        # Nested fields are flattened by Arrow instead of walking dicts in Python
+        df = _flatten(data).to_pandas()
+    else:
+        # Unpack items to have one row for each video
+        df = data.explode("items")
+        df = pd.json_normalize(df["items"])
+    instrument.count("rows.raw_videos", len(df))
+
+    # Videos without tags or topics do not have these columns at all
+    for col in ["snippet.tags", "topicDetails.topicCategories"]:
+        if col not in df.columns:
+            df.loc[:, col] = np.nan
+
+    # Statistics are returned as strings and hidden ones are missing altogether
+    for col in STATISTICS_COLUMNS:
+        values = df[col] if col in df.columns else pd.Series(np.nan, index=df.index)
+        df[col] = pd.to_numeric(values).astype("UInt64")
+
+    # Parse duration once for each video
+    df = df.join(_parse_duration(df["contentDetails.duration"]))
+
+    # Unpack tags to have one tag for one video in each row
+    tags_df = df[["id", "snippet.tags"]].explode("snippet.tags")
+    instrument.count("rows.exploded_tags", len(tags_df))
 
     # Handle missing tags
-    df = df.fillna(value={"snippet.tags": "unknown-marker"})
+    tags_df = tags_df.fillna(value={"snippet.tags": "unknown-marker"})
+    tags_df = tags_df.drop_duplicates()
 
-    # Preprocess duration column
-    df.loc[:, "parsedDuration"] = df.apply(
-        lambda x: ISO_8601.match(x["contentDetails.duration"]).groupdict(), axis=1
+    # Unpack topic categories
+    topics_df = df[["id", "topicDetails.topicCategories"]].explode(
+        "topicDetails.topicCategories"
     )
-    df = df.join(pd.json_normalize(df.parsedDuration))
-    df.fillna(value={col: 0 for col in ["hours", "minutes", "seconds"]}, inplace=True)
-    df = df.astype(
-        dtype={"seconds": np.uint64, "minutes": np.uint64, "hours": np.uint64}
+    topics_df = topics_df.dropna().drop_duplicates()
+
+    videos_df = df.drop(["snippet.tags", "topicDetails.topicCategories"], axis=1)
+
+    tables = {
+        Table.VIDEOS: videos_df.assign(ingestDate=ingest_date),
+        Table.VIDEO_TAGS: tags_df.assign(ingestDate=ingest_date),
+        Table.VIDEO_TOPICS: topics_df.assign(ingestDate=ingest_date),
+    }
+    for table, table_df in tables.items():
+        instrument.count(f"rows.{table.value}", len(table_df))
+    return tables
+
+
+def _add_category(
+    batch: pa.RecordBatch,
+    categories: Dict[str, pa.Array],
+    schema: pa.Schema,
+    columns: List[str],
+) -> pa.RecordBatch:
+    # Position of each video in categories, null for videos without category
+    indices = pc.index_in(batch.column("id"), value_set=categories["vid"])
+
+    # Replace categories assigned earlier, if any
+    arrays = [
+        batch.column(idx)
+        for idx, name in enumerate(batch.schema.names)
+        if name not in CATEGORY_COLUMNS
+    ]
+    return pa.RecordBatch.from_arrays(
+        [*arrays, *(categories[column].take(indices) for column in columns)],
+        schema=schema,
     )
-    df.loc[:, "duration"] = (
-        df["seconds"] + (df["minutes"] * 60) + (df["hours"] * 60 * 60)
+
+
+def _with_categories(
+    reader: pa.RecordBatchReader, cdf: pd.DataFrame, table: Table = Table.VIDEOS
+) -> pa.RecordBatchReader:
+    """Join categories of videos to rows of the table batch by batch"""
+    categories = {
+        "vid": pa.array(cdf["vid"], type=pa.string()),
+        "categoryCode": pa.array(cdf["categoryCode"], type=pa.int32()),
+        "category": pa.array(cdf["category"], type=pa.string()),
+    }
+    columns = TABLE_CATEGORY_COLUMNS[table]
+
+    schema = pa.schema(
+        [field for field in reader.schema if field.name not in CATEGORY_COLUMNS]
     )
+    for column in columns:
+        schema = schema.append(pa.field(column, categories[column].type))
 
-    return df
+    return pa.RecordBatchReader.from_batches(
+        schema,
+        (_add_category(batch, categories, schema, columns) for batch in reader),
+    )
 
 
-def categorize_videos() -> pd.DataFrame:
-    df = load_processed_data(data_type=DataType.PREPROCESSED)
+def categorize_videos(
+    max_features: Optional[int] = MAX_FEATURES,
+    min_df: int = MIN_DF,
+    n_clusters: Union[int, str] = N_CLUSTERS,
+) -> Dict[Table, pa.RecordBatchReader]:
+    """Assign category to each video of preprocessed data using its tags
+
+    Categories are assigned using the persisted category model, which is trained on
+    the preprocessed data only if it does not exist yet. Only video ids and tags are
+    loaded in memory for categorization. Categories are joined to all the tables
+    batch by batch while data is being written, hence memory usage does not depend on the
+    number of preprocessed chunks
+    """
+    tags_df = load_processed_data(
+        columns=["id", "snippet.tags"],
+        data_type=DataType.PREPROCESSED,
+        table=Table.VIDEO_TAGS,
+    )
+    cdf = _normalize_tags(tags_df)
+    del tags_df
+
+    model = load_model(CATEGORY_MODEL)
+    if model is None:
+        model = train_category_model(
+            cdf,
+            max_features=max_features,
+            min_df=min_df,
+            n_clusters=n_clusters,
+            data_fingerprint=cache.fingerprint(DataType.PREPROCESSED, Table.VIDEO_TAGS),
+        )
+        dump_model(model, CATEGORY_MODEL)
 
     # Compute category for the videos
-    cdf = _categorize_videos(df)
-    df = pd.merge(df, cdf, left_on=["id"], right_on=["vid"], how="left")
+    cdf = _assign_categories(cdf, model)
 
-    return df
+    return {
+        table: _with_categories(
+            load_batches(data_type=DataType.PREPROCESSED, table=table), cdf, table
+        )
+        for table in Table
+    }
+
+
+def recategorize_videos(
+    max_features: Optional[int] = MAX_FEATURES,
+    min_df: int = MIN_DF,
+    n_clusters: Union[int, str] = N_CLUSTERS,
+) -> Dict[Table, pa.RecordBatchReader]:
+    """Retrain category model on the entire data lake and reassign categories
+
+    Returns all tables of the data lake with new categories, as tags and topics
+    are stamped with category of their videos too
+    """
+    tags_df = load_processed_data(
+        columns=["id", "snippet.tags"],
+        data_type=DataType.DATA_LAKE,
+        table=Table.VIDEO_TAGS,
+    )
+    cdf = _normalize_tags(tags_df)
+    del tags_df
+
+    model = train_category_model(
+        cdf,
+        max_features=max_features,
+        min_df=min_df,
+        n_clusters=n_clusters,
+        data_fingerprint=cache.fingerprint(DataType.DATA_LAKE, Table.VIDEO_TAGS),
+    )
+    dump_model(model, CATEGORY_MODEL)
 
+    cdf = _assign_categories(cdf, model)
 
-def _categorize_videos(df: pd.DataFrame) -> pd.DataFrame:
-    def _preprocess_text(text: str) -> str:
-        return (
-            text.translate(str.maketrans("", "", string.punctuation))
-            .translate(str.maketrans("", "", string.digits))
-            .lower()
+    return {
+        table: _with_categories(
+            load_batches(data_type=DataType.DATA_LAKE, table=table), cdf, table
         )
+        for table in Table
+    }
+
+
+def _fit_clusters(
+    word_matrix: "sparse.csr_matrix",
+    n_clusters: int,
+    batch_size: int = CLUSTERING_BATCH_SIZE,
+    n_epochs: int = CLUSTERING_EPOCHS,
+) -> "MiniBatchKMeans":
+    """Fit clusters over sparse word matrix one batch of rows at a time"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        batch_size=batch_size,
+        n_init=3,
+        random_state=RANDOM_STATE,
+    )
 
-    required_cols = ["id", "snippet.tags"]
-    cdf = df[required_cols]
+    n_rows = word_matrix.shape[0]
 
-    cdf.loc[:, "processedTag"] = cdf["snippet.tags"].map(lambda x: x.split(" "))
-    cdf = cdf.explode("processedTag")
+    # First batch must have at least as many rows as clusters to initialize them
+    batch_size = max(batch_size, n_clusters)
 
-    # Remove non-english tags
-    isEng = lambda x: re.sub(ENGLISH_LETTERS, "", x)
-    cdf["processedTag"] = np.vectorize(isEng)(cdf["processedTag"])
+    rng = np.random.default_rng(RANDOM_STATE)
+    for _ in range(n_epochs):
+        rows = rng.permutation(n_rows)
+        for start in range(0, n_rows, batch_size):
+            kmeans.partial_fit(word_matrix[rows[start : start + batch_size]])
 
-    cdf.loc[:, "processedTag"] = (
-        cdf["processedTag"]
-        .map(
-            _preprocess_text,
-        )
-        .map(remove_stopwords)
-    )
+    return kmeans
 
-    # Remove rows with missing tags
-    cdf = cdf[cdf["processedTag"] != ""]
 
-    # Remove python tag as its most common one
-    cdf = cdf[cdf["processedTag"] != "python"]
+# Drop digits from words. Punctuation is already removed with `ENGLISH_LETTERS`
+_REMOVE_DIGITS = str.maketrans("", "", string.digits)
 
-    def _stemmer(text: str) -> str:
-        stemmer = PorterStemmer()
-        return stemmer.stem_sentence(text)
 
-    cdf.loc[:, "stemmedTag"] = cdf.apply(lambda x: _stemmer(x["processedTag"]), axis=1)
+@lru_cache(maxsize=1)
+def _get_stemmer():
+    from gensim.parsing.porter import PorterStemmer
 
-    cdf = cdf.drop_duplicates(subset=["id", "stemmedTag"])
+    return PorterStemmer()
+
+
+@lru_cache(maxsize=TAG_CACHE_SIZE)
+def _normalize_word(word: str) -> Tuple[str, str]:
+    """Return cleaned up and stemmed form of a word of a tag"""
+    from gensim.parsing.preprocessing import remove_stopwords
+
+    text = re.sub(ENGLISH_LETTERS, "", word).translate(_REMOVE_DIGITS).lower()
+    text = remove_stopwords(text)
+    return text, _get_stemmer().stem_sentence(text) if text else text
 
-    vectorizer = TfidfVectorizer(analyzer="word", ngram_range=(1, 2))
-    word_matrix = vectorizer.fit_transform(cdf["stemmedTag"])
 
-    word_df = pd.DataFrame(
-        word_matrix.toarray(), columns=vectorizer.get_feature_names_out()
+def _normalize_tags(df: pd.DataFrame) -> pd.DataFrame:
+    """Split tags into words, clean them up and stem them
+
+    Tags repeat heavily across videos, hence each distinct word is normalized only
+    once and results are mapped back to the words using their codes. Returns one
+    row for each distinct stemmed word of a video
+    """
+    tags = df["snippet.tags"].reset_index(drop=True)
+    words = tags.str.split(" ").explode().dropna()
+
+    codes, uniques = pd.factorize(words)
+    normalized = [_normalize_word(word) for word in uniques]
+    processed = np.array([text for text, _ in normalized], dtype=object)
+    stemmed = np.array([stem for _, stem in normalized], dtype=object)
+
+    cdf = pd.DataFrame(
+        {
+            "id": df["id"].to_numpy()[words.index],
+            "processedTag": processed[codes],
+            "stemmedTag": stemmed[codes],
+        }
     )
-    video_df = cdf[["id"]].rename(columns={"id": "vid"})
-    result = video_df.join(word_df)
 
-    # Number of clusters decided by elbow method
-    n_cluster = 4
+    # Remove rows with missing tags
+    # Remove python tag as its most common one
+    cdf = cdf[~cdf["processedTag"].isin(["", "python"])]
+
+    return cdf.drop_duplicates(subset=["id", "stemmedTag"]).reset_index(drop=True)
+
+
+def _score_clusters(word_matrix: "sparse.csr_matrix", n_clusters: int) -> Dict:
+    from sklearn.metrics import silhouette_score
+
+    kmeans = _fit_clusters(word_matrix, n_clusters=n_clusters)
+    labels = kmeans.predict(word_matrix)
+    return {
+        "n_clusters": n_clusters,
+        "inertia": kmeans.inertia_,
+        "silhouette": (
+            silhouette_score(word_matrix, labels) if len(set(labels)) > 1 else -1.0
+        ),
+    }
+
+
+def select_n_clusters(
+    word_matrix: "sparse.csr_matrix",
+    cache_key: Optional[str] = None,
+    data_fingerprint: Optional[str] = None,
+    n_jobs: int = -1,
+) -> int:
+    """Select number of clusters with the best silhouette score
+
+    Every number of clusters in `AUTO_CLUSTERS_RANGE` is evaluated on a sample of
+    rows in parallel processes. Scores are cached against fingerprint of the data
+    """
+    from joblib import Parallel, delayed
+
+    scores = None
+    if cache_key and data_fingerprint:
+        scores = cache.load(cache_key, data_fingerprint)
+
+    if scores is None:
+        n_rows = word_matrix.shape[0]
+        rng = np.random.default_rng(RANDOM_STATE)
+        rows = rng.choice(
+            n_rows, size=min(n_rows, AUTO_CLUSTERS_SAMPLE_SIZE), replace=False
+        )
+        sample = word_matrix[np.sort(rows)]
+
+        # Silhouette score is defined only when there are fewer clusters than rows
+        candidates = [k for k in AUTO_CLUSTERS_RANGE if k < sample.shape[0]]
+        scores = pd.DataFrame(
+            Parallel(n_jobs=n_jobs)(
+                delayed(_score_clusters)(sample, k) for k in candidates
+            )
+        )
+        if cache_key and data_fingerprint:
+            cache.store(cache_key, data_fingerprint, scores)
+
+    best = scores.sort_values(
+        by=["silhouette", "n_clusters"], ascending=[False, True]
+    ).iloc[0]
+    return int(best["n_clusters"])
+
+
+def train_category_model(
+    cdf: pd.DataFrame,
+    max_features: Optional[int] = MAX_FEATURES,
+    min_df: int = MIN_DF,
+    n_clusters: Union[int, str] = N_CLUSTERS,
+    data_fingerprint: Optional[str] = None,
+) -> Dict:
+    """Fit vectorizer and clusters on normalized tags and label the clusters
+
+    The model consists of fitted TF-IDF vectorizer (vocabulary), fitted clusters
+    (centroids) and label of each cluster. Number of clusters is selected
+    automatically when `n_clusters` is "auto"
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    params = {"max_features": max_features, "min_df": min_df, "n_clusters": n_clusters}
+
+    # Order of rows depends on order of files, sort them to train deterministically
+    cdf = cdf.sort_values(by=["id", "stemmedTag"], ignore_index=True)
+
+    # Word matrix is kept in sparse CSR format end to end
+    vectorizer = TfidfVectorizer(
+        analyzer="word", ngram_range=(1, 2), max_features=max_features, min_df=min_df
+    )
+    word_matrix = vectorizer.fit_transform(cdf["stemmedTag"])
+
+    if n_clusters == "auto":
+        n_clusters = select_n_clusters(
+            word_matrix,
+            cache_key=f"cluster_scores__{max_features}_{min_df}",
+            data_fingerprint=data_fingerprint,
+        )
 
-    kmeans = KMeans(n_clusters=n_cluster, max_iter=1000)
-    kmeans.fit(word_df)
-    result.loc[:, "categoryCode"] = kmeans.predict(word_df)
-    result = result[["vid", "categoryCode"]]
+    kmeans = _fit_clusters(word_matrix, n_clusters=n_clusters)
+    cdf = cdf.assign(categoryCode=kmeans.predict(word_matrix))
 
     # Add label for categories
     # Labels are basically most frequently used tag for that category
-    rdf = pd.merge(cdf, result, left_on=["id"], right_on=["vid"], how="left")
-
-    # # Size of each cluster
-    # rdf.drop_duplicates(subset=["vid", "categoryCode"]).groupby(
-    #     by=["categoryCode"]
-    # ).count()
-
-    grp = rdf.groupby(by=["categoryCode"], as_index=False)
+    grp = cdf.groupby(by="categoryCode")
     used_label = set()
-    for category_code in rdf["categoryCode"].unique():
-        top_n_tags = (
+    labels = {}
+    for category_code in sorted(cdf["categoryCode"].unique()):
+        # With more clusters, top few tags may already be used by other categories
+        popular_tags = (
             grp.get_group(category_code)
             .groupby(by=["processedTag"], as_index=False)
-            .agg({"vid": "count"})
-            .sort_values(by=["vid"], ascending=[False])
-            .head(4)["processedTag"]
+            .agg({"id": "count"})
+            .sort_values(by=["id", "processedTag"], ascending=[False, True])[
+                "processedTag"
+            ]
             .tolist()
         )
 
         label = None
-        for popular_tag in top_n_tags:
+        for popular_tag in popular_tags:
             if popular_tag not in used_label:
                 label = popular_tag
                 used_label.add(label)
                 break
-        result.loc[result["categoryCode"] == category_code, "category"] = label
+        labels[category_code] = label
+
+    return {
+        "vectorizer": vectorizer,
+        "kmeans": kmeans,
+        "labels": labels,
+        "n_clusters": n_clusters,
+        "params": params,
+    }
+
+
+def category_model_params() -> Optional[Dict]:
+    """Return parameters the persisted category model was trained with, if any"""
+    model = load_model(CATEGORY_MODEL)
+    if model is None:
+        return None
+
+    # Models trained before their parameters were persisted only have clusters
+    return model.get("params", {"n_clusters": model["n_clusters"]})
+
+
+def _assign_categories(cdf: pd.DataFrame, model: Dict) -> pd.DataFrame:
+    """Assign category to each video using the trained category model"""
+    word_matrix = model["vectorizer"].transform(cdf["stemmedTag"])
+    cdf = cdf.assign(categoryCode=model["kmeans"].predict(word_matrix))
+
+    # Assign each video to the category most of its tags belong to
+    result = (
+        cdf.groupby(by=["id", "categoryCode"], as_index=False)
+        .agg({"stemmedTag": "count"})
+        .sort_values(by=["stemmedTag", "categoryCode"], ascending=[False, True])
+        .drop_duplicates(subset=["id"])
+        .rename(columns={"id": "vid"})
+    )
+    result.loc[:, "category"] = result["categoryCode"].map(model["labels"])
 
-    return result
+    return result[["vid", "categoryCode", "category"]]
 
 
-def _compute_nvideos_metric(for_categories: bool = False) -> pd.DataFrame:
+def _compute_nvideos_metric(df: pd.DataFrame, for_categories: bool = False):
     """Computes number of videos against specified column"""
 
-    # Fetch required columns from the preprocessed storage
-    required_cols = ["id", "snippet.tags"]
-    if for_categories:
-        required_cols.append("category")
-    base_df = load_processed_data(columns=required_cols)
-
-    df = base_df.drop_duplicates(subset=required_cols)
-
     # Rename columns
     df = df.rename(columns={"snippet.tags": "tags"})
 
     # Count number of videos for each `against column`
+    # Rows of a video stored by multiple chunks are dropped while loading
     grp_cols = ["category", "tags"] if for_categories else ["tags"]
     df = (
-        df.groupby(by=grp_cols, as_index=False)
-        .agg({"id": pd.Series.nunique})
+        df.groupby(by=grp_cols, as_index=False, observed=True)
+        .agg({"id": "count"})
         .rename(columns={"id": "n_videos"})
     )
 
-    return df
+    # Groups on categorical columns are not sorted when only observed ones are kept
+    return df.sort_values(by=grp_cols, ignore_index=True)
 
 
-def compute_videos_per_tag() -> pd.DataFrame:
-    """Count number of videos per tag"""
-    return _compute_nvideos_metric()
+def _compute_video_duration_metric(
+    df: pd.DataFrame, for_categories: bool = False
+) -> pd.DataFrame:
+    """Computes total and average duration of videos against specified column"""
 
+    # Rename columns as per requested column name
+    df = df.rename(columns={"snippet.tags": "tag"})
 
-def compute_videos_per_category() -> pd.DataFrame:
-    """Count number of videos per category"""
-    return _compute_nvideos_metric(for_categories=True)
+    grp_cols = ["category", "tag"] if for_categories else ["tag"]
+    df = df.groupby(by=grp_cols, as_index=False, observed=True).agg(
+        total_duration=("duration", "sum"), avg_duration=("duration", "mean")
+    )
 
+    return df.sort_values(by=grp_cols, ignore_index=True)
 
-def compute_tag_with_most_videos() -> pd.DataFrame:
-    return (
-        _compute_nvideos_metric()
-        .sort_values(by=["n_videos"], ascending=[False])
-        .head(1)
-    )
 
+def _compute_engagement_metric(df: pd.DataFrame) -> pd.DataFrame:
+    """Computes total of each statistic of videos and engagement rates per tag
 
-def compute_category_with_most_videos() -> pd.DataFrame:
-    return (
-        _compute_nvideos_metric(for_categories=True)
-        .sort_values(by=["n_videos"], ascending=[False])
-        .groupby(by=["category"], as_index=False)
-        .first()
-    )
+    Rates are likes and comments per view of all videos of the tag
+    """
+    rename_cols = {x: x.split(".")[-1] for x in df.columns}
+    df = df.rename(columns=rename_cols)
+    df = df.drop(["id"], axis=1)
+    df = df.groupby(by=["tags"], as_index=False, observed=True).sum()
+
+    views = df["viewCount"].to_numpy(dtype="float64", na_value=np.nan)
+    for col, rate_col in [("likeCount", "like_rate"), ("commentCount", "comment_rate")]:
+        counts = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df[rate_col] = np.where(views > 0, counts / views, np.nan)
+
+    return df.sort_values(by=["tags"], ignore_index=True)
 
 
-def compute_tag_with_least_videos() -> pd.DataFrame:
-    return (
-        _compute_nvideos_metric().sort_values(by=["n_videos"], ascending=[True]).head(1)
+def _tag_order(tags: pd.Series) -> pd.Series:
+    """Return position of each tag in ascending order of tag names"""
+    if isinstance(tags.dtype, pd.CategoricalDtype) and (
+        tags.cat.categories.is_monotonic_increasing
+    ):
+        return tags.cat.codes
+    return pd.Series(pd.factorize(tags, sort=True)[0], index=tags.index)
+
+
+def _select_k(
+    df: pd.DataFrame, by: str, k: int = 1, largest: bool = True
+) -> pd.DataFrame:
+    """Select k rows with largest or smallest value without sorting all the rows
+
+    Rows are selected for each category when data has category column. Ties are
+    broken by tag name, so that result is deterministic
+    """
+    tag_col = "tags" if "tags" in df.columns else "tag"
+    grp_cols = ["category"] if "category" in df.columns else []
+
+    # Grouping no rows returns frame indexed by the group columns
+    if df.empty:
+        return df.reset_index(drop=True)
+
+    # Tags are unique within a category, hence the value along with position of the
+    # tag selects exactly k rows even when most of the rows have the same value
+    order = _tag_order(df[tag_col])
+    df = df.assign(_order=-order if largest else order)
+
+    def _select(group_df: pd.DataFrame) -> pd.DataFrame:
+        if largest:
+            return group_df.nlargest(k, columns=[by, "_order"])
+        return group_df.nsmallest(k, columns=[by, "_order"])
+
+    if grp_cols:
+        df = df.groupby(by=grp_cols, group_keys=False, observed=True).apply(_select)
+    else:
+        df = _select(df)
+
+    df = df.sort_values(
+        by=[*grp_cols, by, "_order"],
+        ascending=[*[True] * len(grp_cols), not largest, not largest],
     )
+    return df.drop(columns="_order").reset_index(drop=True)
 
 
-def compute_category_with_least_videos() -> pd.DataFrame:
-    return (
-        _compute_nvideos_metric(for_categories=True)
-        .sort_values(by=["n_videos"], ascending=[True])
-        .groupby(by=["category"], as_index=False)
-        .first()
+def _duration(df: pd.DataFrame, agg: str) -> pd.DataFrame:
+    grp_cols = [col for col in ["category", "tag"] if col in df.columns]
+    return df[[*grp_cols, f"{agg}_duration"]].rename(
+        columns={f"{agg}_duration": "duration"}
     )
 
 
-def _compute_video_duration_metric(
-    agg_func: Callable, for_categories: bool = False
+# Aggregates shared by metrics along with columns required to compute them
+AGGREGATES = {
+    "nvideos_per_tag": (["id", "snippet.tags"], _compute_nvideos_metric),
+    "nvideos_per_category": (
+        ["id", "snippet.tags", "category"],
+        partial(_compute_nvideos_metric, for_categories=True),
+    ),
+    "duration_per_tag": (
+        ["id", "snippet.tags", "duration"],
+        _compute_video_duration_metric,
+    ),
+    "duration_per_category": (
+        ["id", "snippet.tags", "duration", "category"],
+        partial(_compute_video_duration_metric, for_categories=True),
+    ),
+    "engagement_per_tag": (
+        ["id", "snippet.tags", *STATISTICS_COLUMNS],
+        _compute_engagement_metric,
+    ),
+}
+
+# Metrics along with the aggregate they are derived from
+METRICS = {
+    "videos_per_tag": ("nvideos_per_tag", lambda df, k: df),
+    "videos_per_category": ("nvideos_per_category", lambda df, k: df),
+    "tag_with_most_videos": (
+        "nvideos_per_tag",
+        lambda df, k: _select_k(df, by="n_videos", k=k, largest=True),
+    ),
+    "category_with_most_videos": (
+        "nvideos_per_category",
+        lambda df, k: _select_k(df, by="n_videos", k=k, largest=True),
+    ),
+    "tag_with_least_videos": (
+        "nvideos_per_tag",
+        lambda df, k: _select_k(df, by="n_videos", k=k, largest=False),
+    ),
+    "category_with_least_videos": (
+        "nvideos_per_category",
+        lambda df, k: _select_k(df, by="n_videos", k=k, largest=False),
+    ),
+    "avg_video_duration_per_tag": (
+        "duration_per_tag",
+        lambda df, k: _duration(df, agg="avg").sort_values(
+            by=["duration"], ascending=[False]
+        ),
+    ),
+    "avg_video_duration_per_category": (
+        "duration_per_category",
+        lambda df, k: _duration(df, agg="avg").sort_values(
+            by=["duration"], ascending=[False]
+        ),
+    ),
+    "most_video_time_tag": (
+        "duration_per_tag",
+        lambda df, k: _select_k(
+            _duration(df, agg="total"), by="duration", k=k, largest=True
+        ),
+    ),
+    "most_video_time_category": (
+        "duration_per_category",
+        lambda df, k: _select_k(
+            _duration(df, agg="total"), by="duration", k=k, largest=True
+        ),
+    ),
+    "least_video_time_tag": (
+        "duration_per_tag",
+        lambda df, k: _select_k(
+            _duration(df, agg="total"), by="duration", k=k, largest=False
+        ),
+    ),
+    "least_video_time_category": (
+        "duration_per_category",
+        lambda df, k: _select_k(
+            _duration(df, agg="total"), by="duration", k=k, largest=False
+        ),
+    ),
+    "engagement_per_tag": ("engagement_per_tag", lambda df, k: df),
+}
+
+# Metrics returning top-k or bottom-k rows i.e their result depends on `k`
+TOP_K_METRICS = {
+    "tag_with_most_videos",
+    "category_with_most_videos",
+    "tag_with_least_videos",
+    "category_with_least_videos",
+    "most_video_time_tag",
+    "most_video_time_category",
+    "least_video_time_tag",
+    "least_video_time_category",
+}
+
+
+def required_columns(metric_names: List[str]) -> List[str]:
+    """Return columns of the data lake required to compute all the metrics"""
+    columns = []
+    for metric_name in metric_names:
+        for col in AGGREGATES[METRICS[metric_name][0]][0]:
+            if col not in columns:
+                columns.append(col)
+    return columns
+
+
+def apply_aggregate(aggregate_name: str, base_df: pd.DataFrame) -> pd.DataFrame:
+    """Compute an aggregate shared by metrics on the loaded data lake"""
+    cols, func = AGGREGATES[aggregate_name]
+    with instrument.stage(f"aggregate.{aggregate_name}"):
+        instrument.count("rows.aggregate_in", len(base_df))
+        df = func(base_df[cols])
+        instrument.count("rows.aggregate_out", len(df))
+    return df
+
+
+def derive_metric(
+    metric_name: str, aggregate_df: pd.DataFrame, k: int = 1
 ) -> pd.DataFrame:
+    """Derive a metric from its aggregate"""
+    with instrument.stage(f"compute.{metric_name}"):
+        df = METRICS[metric_name][1](aggregate_df, k)
+        instrument.count("rows.metric_out", len(df))
+    return df
 
-    # Fetch required columns from the preprocessed storage
-    required_cols = ["id", "snippet.tags", "duration"]
-    if for_categories:
-        required_cols.append("category")
-    base_df = load_processed_data(columns=required_cols)
-    df = base_df.drop_duplicates(subset=required_cols)
 
-    # Rename columns as per requested column name
-    df = df.rename(columns={"snippet.tags": "tag"})
+def compute_metrics(
+    metric_names: List[str], k: int = 1, filters: Optional[List[Filter]] = None
+) -> Dict[str, pd.DataFrame]:
+    """Compute multiple metrics using a single scan of the data lake
 
-    grp_cols = ["category", "tag"] if for_categories else ["tag"]
-    df = df.groupby(by=grp_cols, as_index=False).agg({"duration": agg_func})
+    Columns required by all the metrics are loaded at once. Aggregates shared by
+    metrics e.g number of videos per tag are computed once and each metric is
+    derived from its aggregate. Top-k metrics return `k` rows (per category).
+    Metrics are computed only on videos matching `filters`
+    """
+    with instrument.stage("load_processed_data"):
+        base_df = load_processed_data(
+            columns=required_columns(metric_names), filters=filters
+        )
+
+    aggregates = {
+        aggregate_name: apply_aggregate(aggregate_name, base_df)
+        for aggregate_name in dict.fromkeys(METRICS[name][0] for name in metric_names)
+    }
+    return {
+        name: derive_metric(name, aggregates[METRICS[name][0]], k=k)
+        for name in metric_names
+    }
+
+
+def _compute_metric(metric_name: str, k: int = 1) -> pd.DataFrame:
+    return compute_metrics([metric_name], k=k)[metric_name]
+
+
+def compute_videos_per_tag() -> pd.DataFrame:
+    """Count number of videos per tag"""
+    return _compute_metric("videos_per_tag")
+
+
+def compute_videos_per_category() -> pd.DataFrame:
+    """Count number of videos per category"""
+    return _compute_metric("videos_per_category")
+
+
+def compute_tag_with_most_videos(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("tag_with_most_videos", k=k)
 
-    return df
+
+def compute_category_with_most_videos(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("category_with_most_videos", k=k)
+
+
+def compute_tag_with_least_videos(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("tag_with_least_videos", k=k)
+
+
+def compute_category_with_least_videos(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("category_with_least_videos", k=k)
 
 
 def compute_avg_video_duration_per_tag() -> pd.DataFrame:
-    return _compute_video_duration_metric(agg_func=np.mean).sort_values(
-        by=["duration"], ascending=[False]
-    )
+    return _compute_metric("avg_video_duration_per_tag")
 
 
 def compute_avg_video_duration_per_category() -> pd.DataFrame:
-    return _compute_video_duration_metric(
-        agg_func=np.mean, for_categories=True
-    ).sort_values(by=["duration"], ascending=[False])
+    return _compute_metric("avg_video_duration_per_category")
 
 
-def compute_most_video_time_tag() -> pd.DataFrame:
-    return (
-        _compute_video_duration_metric(agg_func=np.sum)
-        .sort_values(by=["duration"], ascending=[False])
-        .head(1)
-    )
+def compute_most_video_time_tag(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("most_video_time_tag", k=k)
 
 
-def compute_most_video_time_category() -> pd.DataFrame:
-    return (
-        _compute_video_duration_metric(agg_func=np.sum, for_categories=True)
-        .sort_values(by=["duration"], ascending=[False])
-        .groupby(by=["category"], as_index=False)
-        .first()
-    )
+def compute_most_video_time_category(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("most_video_time_category", k=k)
 
 
-def compute_least_video_time_tag() -> pd.DataFrame:
-    return (
-        _compute_video_duration_metric(agg_func=np.sum)
-        .sort_values(by=["duration"], ascending=[True])
-        .head(1)
-    )
+def compute_least_video_time_tag(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("least_video_time_tag", k=k)
 
 
-def compute_least_video_time_category() -> pd.DataFrame:
-    return (
-        _compute_video_duration_metric(agg_func=np.sum, for_categories=True)
-        .sort_values(by=["duration"], ascending=[True])
-        .groupby(by=["category"], as_index=False)
-        .first()
-    )
+def compute_least_video_time_category(k: int = 1) -> pd.DataFrame:
+    return _compute_metric("least_video_time_category", k=k)
 
 
 def compute_engagement_per_tag() -> pd.DataFrame:
-    # Fetch required columns from the preprocessed storage
-    base_df = load_processed_data(
-        columns=[
-            "id",
-            "snippet.tags",
-            "statistics.viewCount",
-            "statistics.likeCount",
-            "statistics.dislikeCount",
-            "statistics.favoriteCount",
-            "statistics.commentCount",
-        ]
-    )
-    df = base_df.drop_duplicates(subset=["id", "snippet.tags"])
-    rename_cols = {x: x.split(".")[-1] for x in df.columns}
-    df = df.rename(columns=rename_cols)
-    df = df.drop(["id"], axis=1)
-    df = df.groupby(by=["tags"], as_index=False).agg(np.sum)
-    return df
+    return _compute_metric("engagement_per_tag")
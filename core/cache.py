@@ -0,0 +1,116 @@
+"""On-disk cache of computed metrics keyed on fingerprint of the data lake"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core import instrument
+from core.io import DataType, Table
+
+CACHE_DIR = os.path.join("/tmp", f"aviyel__{DataType.METRIC_CACHE.value}")
+
+# Least recently used entries are evicted once cache grows beyond this size
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+_enabled = True
+
+
+def configure(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+
+def fingerprint(
+    data_type: DataType = DataType.DATA_LAKE, table: Optional[Table] = None
+) -> str:
+    """Return fingerprint of processed data using path, size and mtime of its files
+
+    Any rewrite of the data e.g by `preprocess` changes the fingerprint. When table
+    is specified, only files of that table are considered
+    """
+    digest = hashlib.sha1()
+    root = Path("/tmp", f"aviyel__{data_type.value}")
+    if table:
+        root = root / table.value
+
+    # Tables are links to directories of their versions, which are followed
+    paths = [
+        Path(dir_path, file_name)
+        for dir_path, _, file_names in os.walk(root, followlinks=True)
+        for file_name in file_names
+    ]
+    for path in sorted(paths):
+        stat = path.stat()
+        digest.update(
+            f"{path.relative_to(root)}:{stat.st_size}:{stat.st_mtime_ns};".encode()
+        )
+    return digest.hexdigest()
+
+
+def _get_cache_path(key: str, data_fingerprint: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}__{data_fingerprint}.parquet")
+
+
+def load(key: str, data_fingerprint: str) -> Optional[pd.DataFrame]:
+    """Return cached data for the key if it was computed on the same data"""
+    if not _enabled:
+        return None
+
+    path = _get_cache_path(key, data_fingerprint)
+    try:
+        df = pq.read_table(path).to_pandas()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+
+    # Mark entry as recently used
+    os.utime(path)
+    return df
+
+
+def store(key: str, data_fingerprint: str, df: pd.DataFrame):
+    """Cache data for the key, which is skipped if it cannot be written
+
+    Cache is an optimization, hence a failure to write it e.g data not convertible
+    to arrow or a full disk never fails the command computing the data
+    """
+    if not _enabled:
+        return
+
+    # Write to a temporary file first so readers never see a partial entry
+    path = _get_cache_path(key, data_fingerprint)
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+        _evict(MAX_CACHE_SIZE)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OSError):
+        instrument.count("cache.store_errors")
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _evict(max_size: int):
+    """Remove least recently used entries until cache fits within max size"""
+    entries = []
+    for entry in Path(CACHE_DIR).glob("*.parquet"):
+        stat = entry.stat()
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
+        total_size -= size
@@ -0,0 +1,50 @@
+"""Data types, tables and defaults shared by the CLI and core modules
+
+Kept free of heavy dependencies, so that they can be imported at startup of the
+CLI without loading pandas, pyarrow or scikit-learn
+"""
+
+from enum import Enum, unique
+
+
+@unique
+class DataType(Enum):
+    YOUTUBE_SEARCH = "ytsearch"
+    YOUTUBE_VIDEO = "ytvideo"
+    PREPROCESSED = "preprocessed"
+    DATA_LAKE = "datalake"
+    FETCH_INDEX = "fetchindex"
+    METRIC_CACHE = "metriccache"
+    MODEL = "model"
+    PIPELINE = "pipeline"
+
+
+@unique
+class Table(Enum):
+    """Tables of processed data. Tags and topics are bridge tables keyed by video id"""
+
+    VIDEOS = "videos"
+    VIDEO_TAGS = "video_tags"
+    VIDEO_TOPICS = "video_topics"
+
+
+# Defaults for compaction i.e size of files (in bytes), number of rows in each
+# row group and compression codec
+TARGET_FILE_SIZE = 128 * 1024 * 1024
+ROW_GROUP_SIZE = 128 * 1024
+COMPRESSION = "zstd"
+
+# Number of rows of each table buffered in memory before they are written when
+# processed data is dumped in buffered mode
+BUFFER_ROWS = 100000
+
+# Formats metrics can be exported in
+EXPORT_FORMATS = ["xlsx", "csv", "parquet", "arrow"]
+
+# Vocabulary of the word matrix used for categorization is capped to the most
+# frequent terms which appear in at least `MIN_DF` tags
+MAX_FEATURES = 10000
+MIN_DF = 1
+
+# Number of clusters i.e categories, decided by elbow method on 500 videos
+N_CLUSTERS = 4
@@ -4,3 +4,15 @@ class InvalidMetric(Exception):
 
 class DataTypeNotSupported(Exception):
     """Raise when certain data type does not support that operation or feature"""
+
+
+class InvalidColumn(Exception):
+    """Raises when requested column does not exist in processed data"""
+
+
+class InvalidFilter(Exception):
+    """Raises when filter on processed data uses an unsupported operator"""
+
+
+class InvalidPipeline(Exception):
+    """Raises when nodes of the pipeline depend on missing nodes or form a cycle"""
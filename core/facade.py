@@ -1,30 +1,75 @@
+import hashlib
 from typing import Optional, List, Dict
 
 import pandas as pd
 
-from core import analyze
-from core.io import export
+from core import analyze, cache, instrument
+from core.io import Filter, export
 from core.exceptions import InvalidMetric
 
 
-def get_metric(metric_name: str) -> pd.DataFrame:
+def _get_cache_key(
+    metric_name: str, k: int, filters: Optional[List[Filter]] = None
+) -> str:
+    key = (
+        f"{metric_name}__k{k}" if metric_name in analyze.TOP_K_METRICS else metric_name
+    )
+    if filters:
+        key = f"{key}__f{hashlib.sha1(repr(filters).encode()).hexdigest()[:16]}"
+    return key
 
-    if not ("tag" in metric_name or "category" in metric_name):
-        raise InvalidMetric(f"{metric_name} is an invalid metric name")
 
-    func_name = f"compute_{metric_name}"
-    func = getattr(analyze, func_name)
-    return func()
+def get_metrics(
+    metric_names: List[str], k: int = 1, filters: Optional[List[Filter]] = None
+) -> Dict[str, pd.DataFrame]:
+    """Compute multiple metrics sharing a single scan of the data lake
+
+    Metrics already computed on the current data lake are served from the cache
+    """
+    for metric_name in metric_names:
+        if metric_name not in analyze.METRICS:
+            raise InvalidMetric(f"{metric_name} is an invalid metric name")
+
+    data_fingerprint = cache.fingerprint()
+
+    metrics = {}
+    for metric_name in metric_names:
+        df = cache.load(_get_cache_key(metric_name, k, filters), data_fingerprint)
+        if df is not None:
+            metrics[metric_name] = df
+
+    missing = [name for name in metric_names if name not in metrics]
+    instrument.count("cache.hits", len(metrics))
+    instrument.count("cache.misses", len(missing))
+    if missing:
+        for metric_name, df in analyze.compute_metrics(
+            missing, k=k, filters=filters
+        ).items():
+            cache.store(_get_cache_key(metric_name, k, filters), data_fingerprint, df)
+            metrics[metric_name] = df
+
+    return {metric_name: metrics[metric_name] for metric_name in metric_names}
+
+
+def get_metric(
+    metric_name: str, k: int = 1, filters: Optional[List[Filter]] = None
+) -> pd.DataFrame:
+    return get_metrics([metric_name], k=k, filters=filters)[metric_name]
 
 
 def export_metric(
-    metrics: List[str], file_name: Optional[str] = None
-) -> Dict[str, str]:
-    """Export metric data in xlsx format"""
-    sheets = {}
-    for metric_name in metrics:
-        df = get_metric(metric_name)
-        sheets[metric_name] = df
-
-    export_file_name = file_name or metric_name
-    return export(file_name=export_file_name, sheets=sheets)
+    metrics: List[str],
+    file_name: Optional[str] = None,
+    k: int = 1,
+    filters: Optional[List[Filter]] = None,
+    export_format: str = "xlsx",
+) -> str:
+    """Export metric data in specified format"""
+    with instrument.stage("get_metrics"):
+        sheets = get_metrics(metrics, k=k, filters=filters)
+
+    export_file_name = file_name or metrics[-1]
+    with instrument.stage("export"):
+        return export(
+            file_name=export_file_name, sheets=sheets, export_format=export_format
+        )
@@ -0,0 +1,50 @@
+"""Concurrent engine to fetch video details for search results"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
+
+from core.youtube_api import fetch_video_details_bulk
+
+
+def _video_ids(search_data: Dict) -> List[str]:
+    return [
+        video.get("id", {}).get("videoId") for video in search_data.get("items", [])
+    ]
+
+
+def fetch_video_details_concurrently(
+    search_pages: Iterable[Dict],
+    workers: int = 4,
+    video_ids_filter: Optional[Callable[[List[str]], List[str]]] = None,
+) -> Generator[Tuple[Dict, Dict], None, None]:
+    """Fetch video details of every search page using a pool of worker threads
+
+    Search pages are consumed lazily, so pagination of search results overlaps with
+    fetching video details of pages received earlier. At most `2 * workers` pages
+    are in flight at any moment. Yields tuple of search page and its video details
+    in the same order as search pages
+
+    `video_ids_filter` is called with video ids of each search page and only the
+    returned ids are fetched e.g to skip videos fetched by previous runs
+    """
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for search_data in search_pages:
+            video_ids = _video_ids(search_data)
+            if video_ids_filter:
+                video_ids = video_ids_filter(video_ids)
+
+            future = executor.submit(fetch_video_details_bulk, video_ids)
+            in_flight.append((search_data, future))
+
+            # Hand over finished pages early and block only when too many are pending
+            while in_flight and (
+                in_flight[0][1].done() or len(in_flight) >= 2 * workers
+            ):
+                search_data, future = in_flight.popleft()
+                yield search_data, future.result()
+
+        while in_flight:
+            search_data, future = in_flight.popleft()
+            yield search_data, future.result()
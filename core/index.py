@@ -0,0 +1,114 @@
+"""Persistent index of fetched videos and search pagination checkpoints"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.constants import DataType
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS missing_videos (
+    id TEXT PRIMARY KEY,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    keyword TEXT PRIMARY KEY,
+    page_token TEXT NOT NULL,
+    total_fetched INTEGER NOT NULL
+);
+"""
+
+# Maximum number of host parameters allowed in a single sqlite statement
+_MAX_PARAMS = 900
+
+# Seconds after which videos reported as not found e.g private ones are requested again
+MISSING_EXPIRY = 7 * 24 * 60 * 60
+
+
+class FetchIndex:
+    """Index of already fetched video ids
+
+    Fetched videos are never fetched again, hence their statistics are not
+    refreshed by incremental runs. Videos reported as not found are skipped until
+    `MISSING_EXPIRY` passes. It also checkpoints `nextPageToken` of search
+    pagination so that an interrupted `raw` stage can be resumed. Data is kept in
+    sqlite database in /tmp/
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            data_dir = os.path.join("/tmp", f"aviyel__{DataType.FETCH_INDEX.value}")
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, "index.sqlite3")
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "FetchIndex":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def filter_unseen(self, video_ids: List[str]) -> List[str]:
+        """Return ids which are neither fetched nor recently missing, preserving order"""
+        seen = set()
+        checked_after = time.time() - MISSING_EXPIRY
+        for start in range(0, len(video_ids), _MAX_PARAMS // 2):
+            chunk = video_ids[start : start + _MAX_PARAMS // 2]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT id FROM videos WHERE id IN ({placeholders})"
+                f" UNION SELECT id FROM missing_videos WHERE id IN ({placeholders})"
+                " AND checked_at > ?",
+                [*chunk, *chunk, checked_after],
+            )
+            seen.update(row[0] for row in rows)
+        return [video_id for video_id in video_ids if video_id not in seen]
+
+    def add(self, items: Iterable[Dict]):
+        """Record video items returned by `videos.list` as fetched"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO videos (id) VALUES (?)",
+                [(item["id"],) for item in items],
+            )
+
+    def add_missing(self, video_ids: Iterable[str]):
+        """Record videos reported as not found, they are skipped until expiry"""
+        checked_at = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO missing_videos (id, checked_at) VALUES (?, ?)",
+                [(video_id, checked_at) for video_id in video_ids],
+            )
+
+    def get_checkpoint(self, keyword: str) -> Tuple[Optional[str], int]:
+        """Return page token to resume search from and number of results fetched"""
+        row = self._conn.execute(
+            "SELECT page_token, total_fetched FROM checkpoints WHERE keyword = ?",
+            (keyword,),
+        ).fetchone()
+        return row if row else (None, 0)
+
+    def set_checkpoint(self, keyword: str, page_token: str, total_fetched: int):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (keyword, page_token, total_fetched)"
+                " VALUES (?, ?, ?)",
+                (keyword, page_token, total_fetched),
+            )
+
+    def clear_checkpoint(self, keyword: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE keyword = ?", (keyword,))
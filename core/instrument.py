@@ -0,0 +1,149 @@
+"""Instrumentation of pipeline stages emitted as JSON lines run log
+
+Stages are timed using wall clock and CPU time. Counters e.g rows, bytes or API
+quota units incremented while a stage runs are attributed to it. Every finished
+stage is appended to the run log as a single JSON line, once a run is started
+"""
+
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Generator, Optional
+from uuid import uuid4
+
+RUN_LOG_DIR = os.path.join("/tmp", "aviyel__runlog")
+
+_counters = Counter()
+_lock = threading.Lock()
+
+_run: Optional[Dict] = None
+
+
+def count(name: str, value: int = 1):
+    """Increment counter e.g `rows.video_tags` or `api.quota_units`"""
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def merge(counters: Dict[str, int]):
+    """Add counters collected by other processes e.g workers of a pool"""
+    with _lock:
+        _counters.update(counters)
+
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # Linux reports it in KBs
+    return round(resource.getrusage(who).ru_maxrss / 1024, 2)
+
+
+def _cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _start_measure() -> Dict:
+    return {
+        "started_at": datetime.now().isoformat(timespec="milliseconds"),
+        "counters": snapshot(),
+        "cpu": _cpu_seconds(resource.RUSAGE_SELF),
+        "children_cpu": _cpu_seconds(resource.RUSAGE_CHILDREN),
+        "wall": time.perf_counter(),
+    }
+
+
+def _end_measure(start: Dict) -> Dict:
+    """Return metrics measured since `start` along with counters incremented since"""
+    counters = snapshot()
+    return {
+        "started_at": start["started_at"],
+        "wall_seconds": round(time.perf_counter() - start["wall"], 4),
+        "cpu_seconds": round(_cpu_seconds(resource.RUSAGE_SELF) - start["cpu"], 4),
+        "children_cpu_seconds": round(
+            _cpu_seconds(resource.RUSAGE_CHILDREN) - start["children_cpu"], 4
+        ),
+        "max_rss_mb": _max_rss_mb(),
+        "children_max_rss_mb": _max_rss_mb(resource.RUSAGE_CHILDREN),
+        "counters": {
+            key: value - start["counters"].get(key, 0)
+            for key, value in counters.items()
+            if value != start["counters"].get(key, 0)
+        },
+    }
+
+
+def _emit(record: Dict):
+    if _run is None:
+        return
+    record = {"run_id": _run["run_id"], "command": _run["command"], **record}
+    os.makedirs(os.path.dirname(_run["path"]), exist_ok=True)
+    with open(_run["path"], "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def start_run(command: str, path: Optional[str] = None, profile: bool = False):
+    """Start emitting finished stages to the run log
+
+    With `profile`, the run is profiled using cProfile and its stats are dumped
+    next to the run log once the run ends
+    """
+    global _run
+    _run = {
+        "run_id": uuid4().hex,
+        "command": command,
+        "path": path or os.path.join(RUN_LOG_DIR, "runs.jsonl"),
+        "profiler": cProfile.Profile() if profile else None,
+        "start": _start_measure(),
+    }
+    if _run["profiler"]:
+        _run["profiler"].enable()
+    return _run["run_id"]
+
+
+def end_run():
+    """Stop profiling, if enabled, and emit totals of the whole run"""
+    global _run
+    if _run is None:
+        return
+
+    record = {"stage": "run", **_end_measure(_run["start"])}
+    profiler = _run["profiler"]
+    if profiler:
+        profiler.disable()
+        record["profile"] = os.path.join(
+            os.path.dirname(_run["path"]), f"{_run['run_id']}.prof"
+        )
+        os.makedirs(os.path.dirname(record["profile"]), exist_ok=True)
+        profiler.dump_stats(record["profile"])
+
+    _emit(record)
+    _run = None
+
+
+@contextmanager
+def stage(name: str) -> Generator[None, None, None]:
+    """Measure a stage of the pipeline
+
+    Records wall and CPU time, including worker processes which finished during
+    the stage, peak resident memory and counters incremented during the stage.
+    Stages can be nested, counters of a stage include those of nested stages
+    """
+    start = _start_measure()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        _emit({"stage": name, **_end_measure(start), "error": error})
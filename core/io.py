@@ -1,26 +1,94 @@
+import glob
 import json
 import os
 import shutil
 import tempfile
-from enum import Enum, unique
 from pathlib import Path, PosixPath
-from typing import Dict, Generator, List, Optional, Union
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
 from uuid import uuid4
 
+import orjson
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
+import pyarrow.json as pj
 import pyarrow.parquet as pq
+import xlsxwriter
 
-from core.exceptions import DataTypeNotSupported
+from core import instrument
+from core.constants import (
+    BUFFER_ROWS,
+    COMPRESSION,
+    EXPORT_FORMATS,
+    ROW_GROUP_SIZE,
+    TARGET_FILE_SIZE,
+    DataType,
+    Table,
+)
+from core.exceptions import DataTypeNotSupported, InvalidColumn, InvalidFilter
 
+# Low cardinality string columns of processed data. They are stored dictionary
+# encoded and loaded as pandas categoricals, hence each distinct value is stored
+# and hashed only once
+DICTIONARY_COLUMNS = [
+    "kind",
+    "snippet.tags",
+    "snippet.channelId",
+    "snippet.channelTitle",
+    "snippet.categoryId",
+    "snippet.liveBroadcastContent",
+    "snippet.defaultLanguage",
+    "snippet.defaultAudioLanguage",
+    "contentDetails.definition",
+    "contentDetails.dimension",
+    "contentDetails.caption",
+    "contentDetails.projection",
+    "topicDetails.topicCategories",
+    "category",
+    "ingestDate",
+]
 
-@unique
-class DataType(Enum):
-    YOUTUBE_SEARCH = "ytsearch"
-    YOUTUBE_VIDEO = "ytvideo"
-    PREPROCESSED = "preprocessed"
-    DATA_LAKE = "datalake"
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# Columns used to hive partition tables of processed data e.g `category=ai`.
+# Filters on them skip entire directories. Columns missing in the data e.g
+# category before categorization, are not used for partitioning
+PARTITION_COLUMNS = {
+    Table.VIDEOS: ["ingestDate", "category"],
+    Table.VIDEO_TAGS: ["ingestDate", "category"],
+    Table.VIDEO_TOPICS: ["ingestDate", "category"],
+}
+
+# Rows of tables are sorted on these columns while compacting them
+SORT_COLUMNS = {
+    Table.VIDEOS: ["id"],
+    Table.VIDEO_TAGS: ["snippet.tags", "id"],
+    Table.VIDEO_TOPICS: ["topicDetails.topicCategories", "id"],
+}
+
+# Limits of a sheet of xlsx workbook i.e number of rows excluding header and
+# length of its name
+XLSX_MAX_ROWS = 1048575
+XLSX_MAX_SHEET_NAME = 31
+
+# Number of rows converted at once while exporting them row by row
+EXPORT_BATCH_ROWS = 100000
+
+# Filter on a column of processed data e.g ("category", "=", "ai")
+Filter = Tuple[str, str, Any]
+
+FILTER_OPERATORS = {
+    "=": lambda field, value: field == value,
+    "==": lambda field, value: field == value,
+    "!=": lambda field, value: field != value,
+    "<": lambda field, value: field < value,
+    "<=": lambda field, value: field <= value,
+    ">": lambda field, value: field > value,
+    ">=": lambda field, value: field >= value,
+    "in": lambda field, value: field.isin(value),
+    "not in": lambda field, value: ~field.isin(value),
+}
 
 
 def _dump_as_json(data: List, data_type: DataType) -> str:
@@ -29,57 +97,566 @@ def _dump_as_json(data: List, data_type: DataType) -> str:
     path = os.path.join(DATA_DIR, f"{filename}.json")
     with open(path, "w") as f:
         f.write(json.dumps(data))
+    instrument.count("io.bytes_written", os.path.getsize(path))
     return path
 
 
-def _dump_as_parquet(data: pd.DataFrame, data_type: DataType) -> str:
-    path = os.path.join("/tmp", f"aviyel__{data_type.value}")
-    table = pa.Table.from_pandas(data)
-    pq.write_to_dataset(table, root_path=path)
+# Extension of raw files stored as newline delimited JSON for each compression
+NDJSON_EXTENSIONS = {None: "ndjson", "gzip": "ndjson.gz", "zstd": "ndjson.zst"}
+
+# Fields of raw video details whose type must not be inferred e.g ISO 8601 dates
+# would be parsed as timestamps. Other fields are inferred
+NDJSON_SCHEMA = pa.schema([("snippet", pa.struct([("publishedAt", pa.string())]))])
+
+
+def dump_ndjson(
+    items: List[Dict], data_type: DataType, compression: Optional[str] = None
+) -> str:
+    """Write items as newline delimited JSON, compressed using gzip or zstd
+
+    Each item is written on its own line. All files of a data type are kept in the
+    same directory
+    """
+    data_dir = os.path.join("/tmp", f"aviyel__{data_type.value}")
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{uuid4().hex}.{NDJSON_EXTENSIONS[compression]}")
+
+    with pa.output_stream(path, compression=compression) as stream:
+        stream.write(b"".join(orjson.dumps(item) + b"\n" for item in items))
+    instrument.count("io.bytes_written", os.path.getsize(path))
     return path
 
 
-def dump(data: Union[List, pd.DataFrame], data_type: DataType) -> str:
-    """Write data in specified directory in /tmp/"""
+def _load_ndjson(path: Union[str, PosixPath]) -> pa.Table:
+    parse_options = pj.ParseOptions(
+        explicit_schema=NDJSON_SCHEMA, unexpected_field_behavior="infer"
+    )
+    with pa.input_stream(str(path), compression="detect") as stream:
+        return pj.read_json(stream, parse_options=parse_options)
+
+
+def _get_table_path(data_type: DataType, table: Table) -> str:
+    """Return path of the table, i.e a link to the directory of its current version"""
+    return os.path.join("/tmp", f"aviyel__{data_type.value}", table.value)
+
+
+def _new_table_version(path: str) -> str:
+    """Create an empty directory for a new version of the table
+
+    Versions are kept next to the directory of the data type e.g
+    `/tmp/aviyel__datalake.versions/videos-<random>`, so that they are truncated
+    along with it
+    """
+    versions_dir = f"{os.path.dirname(path)}.versions"
+    os.makedirs(versions_dir, exist_ok=True)
+    return tempfile.mkdtemp(dir=versions_dir, prefix=f"{os.path.basename(path)}-")
+
+
+def _ensure_table(path: str):
+    """Create the table pointing to its first version, if it does not exist"""
+    if os.path.lexists(path):
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    version = _new_table_version(path)
+    try:
+        os.symlink(version, path)
+    except FileExistsError:
+        # Created by another process e.g a worker preprocessing another chunk
+        os.rmdir(version)
+
+
+def _dictionary_schema(
+    schema: pa.Schema, exclude: Optional[List[str]] = None
+) -> pa.Schema:
+    for idx, field in enumerate(schema):
+        if field.name in (exclude or []):
+            continue
+        if field.name in DICTIONARY_COLUMNS and field.type == pa.string():
+            schema = schema.set(idx, field.with_type(DICTIONARY_TYPE))
+    return schema
+
+
+def _encode_dictionaries(
+    table: pa.Table, exclude: Optional[List[str]] = None
+) -> pa.Table:
+    """Dictionary encode low cardinality string columns of the table"""
+    for idx, field in enumerate(table.schema):
+        if field.name in (exclude or []):
+            continue
+        if field.name in DICTIONARY_COLUMNS and field.type == pa.string():
+            table = table.set_column(
+                idx, field.with_type(DICTIONARY_TYPE), pc.dictionary_encode(table[idx])
+            )
+    return table
+
+
+def _get_partitioning(table: Table, schema: pa.Schema) -> Optional[ds.Partitioning]:
+    fields = [
+        pa.field(column, pa.string())
+        for column in PARTITION_COLUMNS[table]
+        if column in schema.names
+    ]
+    return ds.partitioning(pa.schema(fields), flavor="hive") if fields else None
+
+
+def _dump_batches(
+    reader: pa.RecordBatchReader, path: str, table: Table, name: Optional[str] = None
+):
+    """Write record batches one by one into new parquet files
+
+    Batches are split into hive partitions of the table, each of them gets a new
+    file. Files are named after `name` when specified, so writing the same data
+    again replaces its files in all the partitions, e.g the chunk preprocessed
+    again on a later date. Other existing files are left untouched
+    """
+    # Partitions of the data may differ from those it was written to earlier
+    if name and os.path.isdir(path):
+        for part in Path(path).glob(f"**/{name}-*.parquet"):
+            if part.stem.rsplit("-", 1)[0] == name:
+                part.unlink()
+
+    partitioning = _get_partitioning(table, reader.schema)
+    partition_columns = partitioning.schema.names if partitioning else []
+
+    # Partition columns are stored as directory names, hence they are kept as is
+    schema = _dictionary_schema(reader.schema, exclude=partition_columns)
+    batches = (
+        batch
+        for chunk in reader
+        for batch in _encode_dictionaries(
+            pa.Table.from_batches([chunk], schema=reader.schema),
+            exclude=partition_columns,
+        ).to_batches()
+    )
+    written = []
+    ds.write_dataset(
+        batches,
+        path,
+        schema=schema,
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"{name or uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        use_threads=False,
+        file_visitor=lambda written_file: written.append(written_file.path),
+    )
+    instrument.count("io.files_written", len(written))
+    instrument.count("io.bytes_written", sum(map(os.path.getsize, written)))
+
+
+def _dump_as_parquet(
+    data: Dict[Table, Union[pd.DataFrame, pa.RecordBatchReader]],
+    data_type: DataType,
+    name: Optional[str] = None,
+) -> str:
+    for table_name, table_data in data.items():
+        if not isinstance(table_data, pa.RecordBatchReader):
+            table = pa.Table.from_pandas(table_data, preserve_index=False)
+            table_data = pa.RecordBatchReader.from_batches(
+                table.schema, table.to_batches()
+            )
+        path = _get_table_path(data_type, table_name)
+        _ensure_table(path)
+        _dump_batches(table_data, path, table_name, name=name)
+    return os.path.join("/tmp", f"aviyel__{data_type.value}")
+
+
+def dump(
+    data: Union[List, Dict[Table, Union[pd.DataFrame, pa.RecordBatchReader]]],
+    data_type: DataType,
+    name: Optional[str] = None,
+) -> str:
+    """Write data in specified directory in /tmp/
+
+    Processed data is passed as a mapping of table to its data. Data passed as
+    record batch reader is streamed to the disk batch by batch
+    """
     store_as_json = data_type in [DataType.YOUTUBE_SEARCH, DataType.YOUTUBE_VIDEO]
     return (
         _dump_as_json(data, data_type)
         if store_as_json
-        else _dump_as_parquet(data, data_type)
+        else _dump_as_parquet(data, data_type, name=name)
     )
 
 
+def buffer_tables(
+    chunks: Iterable[Dict[Table, pd.DataFrame]], max_rows: int = BUFFER_ROWS
+) -> Generator:
+    """Merge consecutive chunks of processed data until a table has `max_rows` rows
+
+    Dumping merged chunks writes fewer and larger files than dumping each chunk
+    """
+    buffer, n_rows = {}, {}
+    for chunk in chunks:
+        for table, df in chunk.items():
+            buffer.setdefault(table, []).append(df)
+            n_rows[table] = n_rows.get(table, 0) + len(df)
+
+        if max(n_rows.values(), default=0) >= max_rows:
+            yield {
+                table: pd.concat(dfs, ignore_index=True)
+                for table, dfs in buffer.items()
+            }
+            buffer, n_rows = {}, {}
+
+    if buffer:
+        yield {
+            table: pd.concat(dfs, ignore_index=True) for table, dfs in buffer.items()
+        }
+
+
+def _get_dataset(data_type: DataType, table: Table) -> ds.Dataset:
+    # Data written before columns were dictionary encoded is decoded the same way
+    parquet_format = ds.ParquetFileFormat(dictionary_columns=DICTIONARY_COLUMNS)
+
+    # Partition values are always strings, they are not inferred as numbers
+    partitioning = ds.partitioning(
+        pa.schema(
+            [pa.field(column, pa.string()) for column in PARTITION_COLUMNS[table]]
+        ),
+        flavor="hive",
+    )
+    # Link is resolved once, so that files of a single version are read even if the
+    # table is swapped meanwhile
+    return ds.dataset(
+        os.path.realpath(_get_table_path(data_type, table)),
+        format=parquet_format,
+        partitioning=partitioning,
+    )
+
+
+def _to_expression(
+    filters: Optional[List[Filter]], names: List[str]
+) -> Optional[ds.Expression]:
+    """Combine filters on the given columns into a single dataset expression"""
+    expression = None
+    for column, operator, value in filters or []:
+        if column not in names:
+            continue
+        if operator not in FILTER_OPERATORS:
+            raise InvalidFilter(f"{operator} is not a supported filter operator")
+        condition = FILTER_OPERATORS[operator](ds.field(column), value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def load_batches(
+    data_type: DataType, table: Table, columns: Optional[List[str]] = None
+) -> pa.RecordBatchReader:
+    """Stream processed data of a table as record batches without loading it all"""
+    dataset = _get_dataset(data_type, table)
+
+    scanner_kwargs = {}
+    schema = dataset.schema
+    if columns:
+        scanner_kwargs["columns"] = columns
+        schema = pa.schema([schema.field(column) for column in columns])
+    batches = dataset.scanner(**scanner_kwargs).to_batches()
+    return pa.RecordBatchReader.from_batches(schema, batches)
+
+
+def overwrite_table(
+    reader: pa.RecordBatchReader, data_type: DataType, table: Table
+) -> str:
+    """Replace data of a table with the record batches
+
+    New data is written to a new version of the table, which is swapped in only
+    once it is complete
+    """
+    path = _get_table_path(data_type, table)
+    new_path = _new_table_version(path)
+
+    _dump_batches(reader, new_path, table)
+    _swap_table(path, new_path)
+
+    return path
+
+
+def _swap_table(path: str, new_path: str):
+    """Point the table to its new version atomically
+
+    The link of the table is replaced by renaming a new link over it, hence readers
+    see either the previous or the new version and never a missing table. The
+    previous version is kept until the next swap, so that readers which started
+    before the swap can finish. Older versions and directories left over by
+    interrupted swaps are removed
+    """
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+
+    # Tables written before they were versioned are moved to a version first, which
+    # is the only swap leaving the table missing for a moment
+    if os.path.isdir(path) and not previous:
+        previous = _new_table_version(path)
+        os.rmdir(previous)
+        os.rename(path, previous)
+
+    tmp_link = f"{path}.{uuid4().hex}.link"
+    os.symlink(new_path, tmp_link)
+    os.replace(tmp_link, path)
+
+    versions_dir = f"{os.path.dirname(path)}.versions"
+    table_name = os.path.basename(path)
+    leftovers = [
+        *glob.glob(os.path.join(versions_dir, f"{table_name}-*")),
+        *glob.glob(f"{path}.*.new"),
+        *glob.glob(f"{path}.*.old"),
+        *glob.glob(f"{path}.*.link"),
+    ]
+    for leftover in leftovers:
+        if os.path.realpath(leftover) in [os.path.realpath(new_path), previous]:
+            continue
+        if os.path.islink(leftover):
+            os.remove(leftover)
+        else:
+            shutil.rmtree(leftover, ignore_errors=True)
+
+
+def _sort_table(table: pa.Table, columns: List[str]) -> pa.Table:
+    # Dictionary encoded columns are sorted by their values and not their codes
+    keys = pa.table(
+        {
+            column: (
+                pc.cast(table[column], pa.string())
+                if pa.types.is_dictionary(table.schema.field(column).type)
+                else table[column]
+            )
+            for column in columns
+        }
+    )
+    indices = pc.sort_indices(
+        keys, sort_keys=[(column, "ascending") for column in columns]
+    )
+    return table.take(indices)
+
+
+def compact_table(
+    data_type: DataType,
+    table: Table,
+    target_file_size: int = TARGET_FILE_SIZE,
+    row_group_size: int = ROW_GROUP_SIZE,
+    compression: str = COMPRESSION,
+) -> str:
+    """Merge small files of each partition of a table into files of target size
+
+    Rows of each partition are sorted, so that row groups cover narrow ranges of
+    tags or ids and filters on them skip most of the row groups. A partition is
+    loaded in memory at once. Compacted table is written to a new version of the
+    table and swapped in only once it is complete
+    """
+    path = _get_table_path(data_type, table)
+    new_path = _new_table_version(path)
+
+    # Files are read from the current version, even if it is swapped meanwhile
+    source = os.path.realpath(path)
+    parquet_format = ds.ParquetFileFormat(dictionary_columns=DICTIONARY_COLUMNS)
+    dataset = ds.dataset(source, format=parquet_format)
+
+    # Partition values are part of directory names, hence files are compacted
+    # directory by directory
+    partitions = {}
+    for file_path in dataset.files:
+        partitions.setdefault(os.path.dirname(file_path), []).append(file_path)
+
+    for partition, files in sorted(partitions.items()):
+        data = ds.dataset(files, format=parquet_format).to_table()
+        data = _sort_table(
+            data, [c for c in SORT_COLUMNS[table] if c in data.schema.names]
+        )
+
+        # Size of files decides number of rows per file, assuming compaction does
+        # not change the size of rows
+        size = sum(os.path.getsize(file_path) for file_path in files)
+        instrument.count("io.bytes_read", size)
+        rows_per_file = max(
+            1, int(target_file_size * data.num_rows / size) if size else data.num_rows
+        )
+
+        partition_path = os.path.join(new_path, os.path.relpath(partition, source))
+        os.makedirs(partition_path, exist_ok=True)
+        for part, start in enumerate(range(0, data.num_rows, rows_per_file)):
+            part_path = os.path.join(partition_path, f"part-{part}.parquet")
+            pq.write_table(
+                data.slice(start, rows_per_file),
+                part_path,
+                row_group_size=row_group_size,
+                compression=compression,
+            )
+            instrument.count("io.bytes_written", os.path.getsize(part_path))
+
+    _swap_table(path, new_path)
+    return path
+
+
+def _get_model_path(name: str) -> str:
+    return os.path.join("/tmp", f"aviyel__{DataType.MODEL.value}", f"{name}.joblib")
+
+
+def dump_model(model: Any, name: str) -> str:
+    import joblib
+
+    path = _get_model_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    joblib.dump(model, tmp_path)
+    instrument.count("io.bytes_written", os.path.getsize(tmp_path))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model(name: str) -> Optional[Any]:
+    """Load persisted model, returns None if it does not exist"""
+    import joblib
+
+    path = _get_model_path(name)
+    if not os.path.exists(path):
+        return None
+    return joblib.load(path)
+
+
+def _load_table(
+    data_type: DataType,
+    table: Table,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Filter]] = None,
+) -> pd.DataFrame:
+    dataset = _get_dataset(data_type, table)
+
+    scanner_kwargs = {}
+    if columns:
+        scanner_kwargs["columns"] = columns
+    expression = _to_expression(filters, dataset.schema.names)
+    if expression is not None:
+        scanner_kwargs["filter"] = expression
+
+    # Only files of partitions matching filters are read
+    files = [
+        fragment.path
+        for fragment in dataset.get_fragments(
+            filter=expression if expression is not None else ds.scalar(True)
+        )
+    ]
+    instrument.count("io.bytes_read", sum(map(os.path.getsize, files)))
+
+    # Partition columns are not stored in files, encode them like stored columns
+    data = _encode_dictionaries(dataset.scanner(**scanner_kwargs).to_table())
+    instrument.count("io.rows_read", data.num_rows)
+
+    # Unsigned integers with missing values are kept as integers and not floats
+    df = data.to_pandas(types_mapper={pa.uint64(): pd.UInt64Dtype()}.get)
+
+    # Dictionaries of chunks are merged in order of appearance, sort them so that
+    # categoricals sort and group the same way as strings
+    for column in df.select_dtypes(include="category").columns:
+        df[column] = df[column].cat.reorder_categories(
+            df[column].cat.categories.sort_values()
+        )
+    return df
+
+
 def load_processed_data(
     columns: Optional[List[str]] = None,
     data_type: Optional[DataType] = DataType.DATA_LAKE,
+    table: Optional[Table] = None,
+    filters: Optional[List[Filter]] = None,
 ) -> pd.DataFrame:
+    """Load processed data from specified table
+
+    When table is not specified, each column is looked up in all tables and tables
+    holding requested columns are joined on video `id`. Videos table is loaded when
+    neither of them are specified. Rows are filtered by `filters` e.g
+    `[("category", "=", "ai"), ("ingestDate", ">=", "2021-11-01")]` before they are
+    loaded, which skips partitions and row groups not matching them. Only videos
+    matching filters on any of the joined tables are kept. Joined tables have a
+    single row for each video and tag or topic, even if the video is stored by
+    multiple chunks
+    """
 
     if data_type not in [DataType.PREPROCESSED, DataType.DATA_LAKE]:
         raise DataTypeNotSupported(
             f"{data_type.name} does not belong to processed data"
         )
 
-    dataset = ds.dataset(f"/tmp/aviyel__{data_type.value}/")
+    if table or not columns:
+        return _load_table(
+            data_type, table or Table.VIDEOS, columns=columns, filters=filters
+        )
 
-    scanner_kwargs = {}
-    if columns:
-        scanner_kwargs["columns"] = columns
-    table = dataset.scanner(**scanner_kwargs).to_table()
-    return table.to_pandas()
+    # Find table holding each of the requested columns
+    schemas = {
+        candidate: _get_dataset(data_type, candidate).schema.names
+        for candidate in Table
+    }
 
+    def _find_table(column: str) -> Table:
+        for candidate, names in schemas.items():
+            if column in names:
+                return candidate
+        raise InvalidColumn(f"{column} does not exist in {data_type.name} data")
 
-def loads(data_type: DataType, as_dataframe: bool = False) -> Generator:
-    """Loads all files one by one for specified data type"""
+    table_columns = {}
+    for column in columns:
+        if column == "id":
+            continue
+        table_columns.setdefault(_find_table(column), []).append(column)
+
+    # Filter on a column missing in all the loaded tables requires one more table
+    for column, _, _ in filters or []:
+        if not any(column in schemas[candidate] for candidate in table_columns):
+            table_columns.setdefault(_find_table(column), [])
+
+    if not table_columns:
+        return _load_table(data_type, Table.VIDEOS, columns=columns, filters=filters)
+
+    # Join tables on video id only when columns span multiple tables
+    df = None
+    for candidate, candidate_columns in table_columns.items():
+        table_df = _load_table(
+            data_type, candidate, columns=["id", *candidate_columns], filters=filters
+        )
+
+        # A video returned by multiple search pages is stored by each of their
+        # chunks, hence it is loaded once
+        key = ["id"] if candidate == Table.VIDEOS else ["id", *candidate_columns]
+        table_df = table_df.drop_duplicates(subset=key, ignore_index=True)
+
+        if df is None:
+            df = table_df
+            continue
+
+        # Filtered table drops the videos not matching filters from the result
+        filtered = _to_expression(filters, schemas[candidate]) is not None
+        df = df.merge(table_df, on="id", how="inner" if filtered else "left")
+
+    return df[columns]
+
+
+def list_files(data_type: DataType) -> List[Path]:
+    """List all files of specified data type"""
     dirs = Path("/tmp/").glob(f"aviyel__{data_type.value}*")
-    for dir in dirs:
-        for path in dir.glob("**/*"):
-            if as_dataframe:
-                loaded_data = pd.read_json(path)
-            else:
-                with open(path, "r") as f:
-                    loaded_data = json.loads(f.read())
+    return [path for dir in dirs for path in dir.glob("**/*") if path.is_file()]
+
+
+def load_file(path: Union[str, PosixPath], as_dataframe: bool = False) -> Any:
+    """Load a raw file
+
+    Newline delimited JSON files are read straight into Arrow tables, which parses
+    them in C++ using multiple threads
+    """
+    instrument.count("io.bytes_read", os.path.getsize(path))
+    if ".ndjson" in Path(path).suffixes:
+        return _load_ndjson(path)
+    if as_dataframe:
+        return pd.read_json(path)
+    with open(path, "r") as f:
+        return json.loads(f.read())
 
-            yield loaded_data
+
+def loads(data_type: DataType, as_dataframe: bool = False) -> Generator:
+    """Loads all files one by one for specified data type"""
+    for path in list_files(data_type):
+        yield load_file(path, as_dataframe=as_dataframe)
 
 
 def _add_delete_marker_for_file(file_path: Union[str, PosixPath]):
@@ -101,12 +678,87 @@ def add_delete_marker(
             _add_delete_marker_for_file(dir)
 
 
-def export(file_name: str, sheets: Dict[str, pd.DataFrame]) -> str:
-    """Export data in xlsx format"""
-    export_path = os.path.join("/tmp/", f"{file_name}.xlsx")
+def _xlsx_sheet_name(name: str, part: int) -> str:
+    # Sheet names are limited to 31 characters
+    suffix = f"_{part + 1}" if part else ""
+    return f"{name[:XLSX_MAX_SHEET_NAME - len(suffix)]}{suffix}"
+
+
+def _export_as_xlsx(path: str, sheets: Dict[str, pd.DataFrame]):
+    """Write sheets row by row without keeping the workbook in memory
 
-    with pd.ExcelWriter(export_path, engine="xlsxwriter") as writer:
+    Data having more rows than a sheet can hold is split across multiple sheets
+    """
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
         for sheet_name, data in sheets.items():
-            data.to_excel(writer, sheet_name=sheet_name, index=False)
+            n_parts = max(1, -(-len(data) // XLSX_MAX_ROWS))
+            for part in range(n_parts):
+                worksheet = workbook.add_worksheet(_xlsx_sheet_name(sheet_name, part))
+                worksheet.write_row(0, 0, [str(column) for column in data.columns])
+
+                part_start = part * XLSX_MAX_ROWS
+                part_end = min(part_start + XLSX_MAX_ROWS, len(data))
+                for start in range(part_start, part_end, EXPORT_BATCH_ROWS):
+                    batch = data.iloc[start : min(start + EXPORT_BATCH_ROWS, part_end)]
+
+                    # Missing values are left blank, xlsx does not support NaN
+                    batch = batch.astype(object).where(batch.notna(), None)
+                    for offset, row in enumerate(batch.itertuples(index=False)):
+                        worksheet.write_row(start - part_start + offset + 1, 0, row)
+    finally:
+        workbook.close()
+
+
+def _export_as_file(path: str, data: pd.DataFrame, export_format: str):
+    if export_format == "csv":
+        data.to_csv(path, index=False)
+        return
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if export_format == "parquet":
+        pq.write_table(table, path)
+    else:
+        # Uncompressed Arrow IPC file can be memory mapped by consumers
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(
+            sink, table.schema
+        ) as writer:
+            writer.write_table(table)
+
+
+def get_export_path(file_name: str, n_sheets: int, export_format: str = "xlsx") -> str:
+    """Return path of exported file, or directory when sheets are exported to files"""
+    if export_format == "xlsx" or n_sheets == 1:
+        return os.path.join("/tmp/", f"{file_name}.{export_format}")
+    return os.path.join("/tmp/", file_name)
+
+
+def export(
+    file_name: str, sheets: Dict[str, pd.DataFrame], export_format: str = "xlsx"
+) -> str:
+    """Export data in xlsx, csv, parquet or arrow format
+
+    All sheets are written to a single xlsx workbook. For other formats a single
+    sheet is written to a file, while multiple sheets are written to a directory
+    with one file for each sheet
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise DataTypeNotSupported(f"{export_format} is not a supported export format")
+
+    export_path = get_export_path(file_name, len(sheets), export_format)
+    if export_format == "xlsx":
+        _export_as_xlsx(export_path, sheets)
+        instrument.count("io.bytes_written", os.path.getsize(export_path))
+        return export_path
+
+    if len(sheets) == 1:
+        _export_as_file(export_path, next(iter(sheets.values())), export_format)
+        instrument.count("io.bytes_written", os.path.getsize(export_path))
+        return export_path
 
+    os.makedirs(export_path, exist_ok=True)
+    for sheet_name, data in sheets.items():
+        path = os.path.join(export_path, f"{sheet_name}.{export_format}")
+        _export_as_file(path, data, export_format)
+        instrument.count("io.bytes_written", os.path.getsize(path))
     return export_path
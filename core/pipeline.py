@@ -0,0 +1,297 @@
+"""In-process runner of the pipeline as a graph of nodes
+
+A node runs as soon as all of its dependencies are done and independent nodes run
+concurrently using a pool of threads. Results of nodes are kept in memory and
+passed to their dependents, hence the data lake is loaded once and shared by all
+the metrics. Nodes whose inputs and outputs did not change since they last
+succeeded are skipped
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from core import analyze, cache, instrument
+from core.constants import DataType
+from core.exceptions import InvalidPipeline
+from core.io import export, get_export_path, load_processed_data
+
+STATE_PATH = os.path.join("/tmp", f"aviyel__{DataType.PIPELINE.value}", "state.json")
+
+
+class Node:
+    """Node of the pipeline
+
+    `func` is called with results of dependencies keyed by their names. A node is
+    skipped when `fingerprint` of its inputs and outputs is the same as after its
+    last successful run, nodes without it always run. Result of an `in_memory`
+    node is not persisted, hence it runs only when any of its dependents runs
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Any],
+        deps: Optional[List[str]] = None,
+        fingerprint: Optional[Callable[[], str]] = None,
+        in_memory: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.deps = deps or []
+        self.fingerprint = fingerprint
+        self.in_memory = in_memory
+
+
+def fingerprint(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def files_fingerprint(paths: Iterable[Union[str, Path]]) -> str:
+    """Return fingerprint of files using their path, size and mtime"""
+    stats = []
+    for path in sorted(map(Path, paths)):
+        if path.is_file():
+            stat = path.stat()
+            stats.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return fingerprint(stats)
+
+
+def _load_state(path: str) -> Dict[str, str]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _store_state(path: str, state: Dict[str, str]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _validate(nodes: Dict[str, Node]):
+    for node in nodes.values():
+        missing = [dep for dep in node.deps if dep not in nodes]
+        if missing:
+            raise InvalidPipeline(f"{node.name} depends on missing nodes {missing}")
+
+    # Nodes are removed once all of their dependencies are removed, nodes which are
+    # never removed are part of a cycle
+    remaining = dict(nodes)
+    while remaining:
+        removable = [
+            name
+            for name, node in remaining.items()
+            if not any(dep in remaining for dep in node.deps)
+        ]
+        if not removable:
+            raise InvalidPipeline(f"Nodes {sorted(remaining)} form a cycle")
+        for name in removable:
+            del remaining[name]
+
+
+def run_graph(
+    nodes: List[Node],
+    workers: int = 4,
+    force: bool = False,
+    state_path: str = STATE_PATH,
+) -> Dict[str, Dict]:
+    """Run nodes in order of their dependencies, independent nodes concurrently
+
+    Returns status of each node i.e `done`, `skipped`, `failed` or `cancelled` when
+    any of its dependencies failed, along with offsets (in seconds) at which it
+    started and finished. Fingerprints of succeeded nodes are stored as soon as
+    they finish, so an interrupted run resumes from the failed nodes. With
+    `force`, no node is skipped
+    """
+    graph = {node.name: node for node in nodes}
+    _validate(graph)
+
+    dependents = {name: [] for name in graph}
+    for node in nodes:
+        for dep in node.deps:
+            dependents[dep].append(node.name)
+
+    state = _load_state(state_path)
+    report = {name: {"status": "pending"} for name in graph}
+    results = {}
+    fresh = {}
+
+    def _is_fresh(name: str) -> bool:
+        # Decision is kept, so that an in-memory node skipped for its dependents is
+        # never needed by them later
+        if name not in fresh:
+            node = graph[name]
+            if force:
+                fresh[name] = False
+            elif node.in_memory:
+                fresh[name] = all(
+                    _is_fresh(dependent) for dependent in dependents[name]
+                )
+            elif node.fingerprint is None:
+                fresh[name] = False
+            else:
+                fresh[name] = state.get(name) == node.fingerprint()
+        return fresh[name]
+
+    def _execute(node: Node) -> Any:
+        with instrument.stage(f"node.{node.name}"):
+            return node.func({dep: results.get(dep) for dep in node.deps})
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while True:
+            # Skipping a node makes its dependents ready, hence repeat until none
+            changed = True
+            while changed:
+                changed = False
+                for name, node in graph.items():
+                    if report[name]["status"] != "pending":
+                        continue
+                    statuses = [report[dep]["status"] for dep in node.deps]
+                    if any(status in ["failed", "cancelled"] for status in statuses):
+                        report[name]["status"] = "cancelled"
+                    elif any(status not in ["done", "skipped"] for status in statuses):
+                        continue
+                    elif _is_fresh(name):
+                        report[name]["status"] = "skipped"
+                    else:
+                        report[name].update(
+                            status="running",
+                            started=time.perf_counter() - started_at,
+                        )
+                        running[executor.submit(_execute, node)] = name
+                    changed = True
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                report[name]["finished"] = time.perf_counter() - started_at
+                error = future.exception()
+                if error:
+                    report[name].update(status="failed", error=error)
+                    continue
+
+                report[name]["status"] = "done"
+                results[name] = future.result()
+                node = graph[name]
+                if node.fingerprint and not node.in_memory:
+                    state[name] = node.fingerprint()
+                    _store_state(state_path, state)
+
+    return report
+
+
+def critical_path(
+    nodes: List[Node], report: Dict[str, Dict]
+) -> Tuple[List[str], float]:
+    """Return chain of nodes which decided the run time and its total time
+
+    Starts from the node which finished last and walks back through the dependency
+    which finished last, i.e the one the node waited for
+    """
+    graph = {node.name: node for node in nodes}
+    ran = {name: result for name, result in report.items() if "finished" in result}
+    if not ran:
+        return [], 0.0
+
+    path = [max(ran, key=lambda name: ran[name]["finished"])]
+    while True:
+        deps = [dep for dep in graph[path[-1]].deps if dep in ran]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda dep: ran[dep]["finished"]))
+
+    path.reverse()
+    total = sum(ran[name]["finished"] - ran[name]["started"] for name in path)
+    return path, total
+
+
+def metric_nodes(
+    exports: Dict[str, Tuple[List[str], Optional[str]]],
+    deps: Optional[List[str]] = None,
+    k: int = 1,
+    export_format: str = "xlsx",
+) -> List[Node]:
+    """Return nodes computing and exporting metrics from a single load of the lake
+
+    `exports` maps name of each node to metrics exported by it and the name of the
+    exported file, which defaults to the last metric. The data lake is loaded with
+    columns required by all the metrics by a `lake` node, aggregates shared by
+    metrics are computed by an `aggregate.<name>` node and metrics are exported by a
+    `metrics.<name>` node each
+    """
+    metric_names = [name for metrics, _ in exports.values() for name in metrics]
+    aggregate_names = list(
+        dict.fromkeys(analyze.METRICS[name][0] for name in metric_names)
+    )
+
+    def _load_lake(_: Dict) -> pd.DataFrame:
+        return load_processed_data(columns=analyze.required_columns(metric_names))
+
+    def _aggregate(aggregate_name: str) -> Callable[[Dict], pd.DataFrame]:
+        return lambda results: analyze.apply_aggregate(aggregate_name, results["lake"])
+
+    def _export(metrics: List[str], file_name: str) -> Callable[[Dict], str]:
+        def _func(results: Dict) -> str:
+            sheets = {
+                name: analyze.derive_metric(
+                    name, results[f"aggregate.{analyze.METRICS[name][0]}"], k=k
+                )
+                for name in metrics
+            }
+            return export(
+                file_name=file_name, sheets=sheets, export_format=export_format
+            )
+
+        return _func
+
+    def _fingerprint(metrics: List[str], file_name: str) -> Callable[[], str]:
+        def _func() -> str:
+            path = Path(get_export_path(file_name, len(metrics), export_format))
+            files = sorted(path.glob("*")) if path.is_dir() else [path]
+            return fingerprint(
+                cache.fingerprint(), metrics, k, export_format, files_fingerprint(files)
+            )
+
+        return _func
+
+    nodes = [Node("lake", _load_lake, deps=deps, in_memory=True)]
+    nodes.extend(
+        Node(
+            f"aggregate.{aggregate_name}",
+            _aggregate(aggregate_name),
+            deps=["lake"],
+            in_memory=True,
+        )
+        for aggregate_name in aggregate_names
+    )
+    for name, (metrics, file_name) in exports.items():
+        file_name = file_name or metrics[-1]
+        nodes.append(
+            Node(
+                f"metrics.{name}",
+                _export(metrics, file_name),
+                deps=list(
+                    dict.fromkeys(
+                        f"aggregate.{analyze.METRICS[metric][0]}" for metric in metrics
+                    )
+                ),
+                fingerprint=_fingerprint(metrics, file_name),
+            )
+        )
+    return nodes
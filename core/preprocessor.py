@@ -0,0 +1,73 @@
+"""Parallel engine to preprocess chunks of raw video details"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Generator, Iterable, Optional, Tuple, Union
+
+from core import instrument
+from core.analyze import cleanup_video_data
+from core.io import DataType, dump, load_file
+
+
+def preprocess_chunk(path: Union[str, Path], ingest_date: Optional[str] = None) -> str:
+    """Clean up a chunk of raw video details and store it as preprocessed data
+
+    Parquet parts of the chunk are named after the chunk file, hence preprocessing
+    the same chunk again replaces its parts instead of duplicating its rows, even
+    when they are stamped with another ingestion date
+    """
+    data = load_file(path, as_dataframe=True)
+    tables = cleanup_video_data(data, ingest_date=ingest_date)
+
+    # Name of the chunk without any of its extensions e.g `.ndjson.gz`
+    name = Path(path).name.split(".")[0]
+    return dump(data=tables, data_type=DataType.PREPROCESSED, name=name)
+
+
+def _preprocess_chunk_in_worker(
+    path: Union[str, Path], ingest_date: Optional[str] = None
+) -> Dict[str, int]:
+    """Preprocess a chunk and return counters incremented by it in the worker"""
+    before = instrument.snapshot()
+    preprocess_chunk(path, ingest_date=ingest_date)
+    return {
+        key: value - before.get(key, 0)
+        for key, value in instrument.snapshot().items()
+        if value != before.get(key, 0)
+    }
+
+
+def preprocess_concurrently(
+    paths: Iterable[Union[str, Path]],
+    workers: int = 1,
+    ingest_date: Optional[str] = None,
+) -> Generator[Tuple[Path, Optional[Exception]], None, None]:
+    """Preprocess chunks of raw video details using a pool of worker processes
+
+    Chunks are independent, hence each of them is preprocessed by a single worker
+    which writes its own parquet parts. Yields tuple of chunk path and the error
+    raised while preprocessing it, if any, in the order chunks are completed.
+    Failure of a chunk does not stop others. Chunks are preprocessed in the current
+    process when there is a single worker. Counters incremented by workers are
+    merged into counters of the current process
+    """
+    if workers == 1:
+        for path in paths:
+            try:
+                preprocess_chunk(path, ingest_date=ingest_date)
+            except Exception as e:
+                yield Path(path), e
+            else:
+                yield Path(path), None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_preprocess_chunk_in_worker, path, ingest_date): Path(path)
+            for path in paths
+        }
+        for future in as_completed(futures):
+            error = future.exception()
+            if not error:
+                instrument.merge(future.result())
+            yield futures[future], error
@@ -0,0 +1,43 @@
+"""Primitives to throttle and retry requests made to external services"""
+
+import random
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket which limits the rate at which tokens (e.g quota units) are spent
+
+    Tokens are refilled at `rate` per second up to `capacity`. A caller requesting
+    more tokens than available reserves them and sleeps until they are refilled,
+    hence a single request costing more than `capacity` is still allowed
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Spend tokens, blocking until they are available. Returns time waited"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 64.0) -> float:
+    """Exponential backoff delay with full jitter for specified retry attempt"""
+    return random.uniform(0, min(cap, base * (2**attempt)))
@@ -1,9 +1,51 @@
 """Interface to fetch data from YouTube using Google APIs"""
 
+import http.client
 import os
-from typing import Generator, Dict
+import threading
+import time
+from typing import Dict, Generator, List, Optional
 
+import httplib2
 from apiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from core import instrument
+from core.ratelimit import TokenBucket, backoff_delay
+
+# Maximum number of ids accepted by `videos.list` in a single request
+MAX_IDS_PER_REQUEST = 50
+
+# Timeout (in seconds) for a single HTTP request
+HTTP_TIMEOUT = 60
+
+# Quota units charged by YT Data API for a single request
+QUOTA_COST = {"search": 100, "videos": 1}
+
+# HTTP status codes of transient failures i.e rate limits and server errors
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+
+# Transient failures of the transport e.g socket timeouts, connections reset by the
+# server while being reused and failed DNS lookups
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException, httplib2.HttpLib2Error)
+
+# Failure reason of videos silently dropped by the API e.g deleted or private ones
+NOT_FOUND = "not found"
+
+_clients = {}
+_clients_lock = threading.Lock()
+_local = threading.local()
+
+_rate_limiter: Optional[TokenBucket] = None
+_max_retries = 5
+
+
+def configure(quota_per_second: Optional[float] = None, max_retries: int = 5):
+    """Configure throttling and retries of all requests made to YT Data API"""
+    global _rate_limiter, _max_retries
+    _rate_limiter = TokenBucket(rate=quota_per_second) if quota_per_second else None
+    _max_retries = max_retries
 
 
 def _get_google_api_key():
@@ -11,20 +53,91 @@ def _get_google_api_key():
 
 
 def _get_youtube_client():
-    return build("youtube", "v3", developerKey=_get_google_api_key())
+    """Return process wide YouTube client
+
+    The client is built only once per API key from the discovery document shipped
+    with the client library. It is safe to share across threads as long as requests
+    are executed using `_execute`
+    """
+    api_key = _get_google_api_key()
+
+    # Allows pointing the client to a stub server e.g for benchmarks
+    endpoint = os.environ.get("YOUTUBE_API_ENDPOINT")
+
+    with _clients_lock:
+        if (api_key, endpoint) not in _clients:
+            _clients[(api_key, endpoint)] = build(
+                "youtube",
+                "v3",
+                developerKey=api_key,
+                static_discovery=True,
+                cache_discovery=False,
+                client_options={"api_endpoint": endpoint} if endpoint else None,
+            )
+        return _clients[(api_key, endpoint)]
+
+
+def _get_http() -> httplib2.Http:
+    """Return HTTP connection pool owned by the current thread
+
+    `httplib2.Http` is not thread safe, hence each thread keeps its own pool which
+    reuses keep-alive connections across requests
+    """
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = _local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    return http
+
+
+def _execute(request: HttpRequest, quota_cost: int = 1) -> Dict:
+    """Execute request while respecting the quota rate limit
+
+    Transient failures i.e retryable HTTP statuses and transport errors are retried
+    with exponential backoff. Every attempt is counted as an API call charged with
+    `quota_cost` units
+    """
+    attempt = 0
+    while True:
+        if _rate_limiter:
+            _rate_limiter.acquire(quota_cost)
+        instrument.count("api.calls")
+        instrument.count("api.quota_units", quota_cost)
+        try:
+            return request.execute(http=_get_http())
+        except HttpError as e:
+            instrument.count("api.errors")
+            if e.resp.status not in RETRY_STATUSES or attempt >= _max_retries:
+                raise
+        except TRANSPORT_ERRORS:
+            instrument.count("api.errors")
+
+            # Connections of the pool may be broken, retry using new ones
+            _local.http = None
+            if attempt >= _max_retries:
+                raise
+        instrument.count("api.retries")
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
 
 
 def search(
-    keyword: str, max_results: int = 100, max_per_request: int = 25
+    keyword: str,
+    max_results: int = 100,
+    max_per_request: int = 25,
+    page_token: Optional[str] = None,
 ) -> Generator:
-    """Return search results for specified keywords using YT Data API"""
+    """Return search results for specified keywords using YT Data API
+
+    Pagination starts from `page_token` when specified, which allows resuming an
+    interrupted search
+    """
 
     youtube = _get_youtube_client()
 
     max_per_request = min(max_results, max_per_request)
 
     terminate_pagination = False
-    next_page_token = None
+    next_page_token = page_token
     total_fetched = 0
 
     while not terminate_pagination:
@@ -38,7 +151,7 @@ def search(
             params["pageToken"] = next_page_token
 
         request = youtube.search().list(**params)
-        response = request.execute()
+        response = _execute(request, quota_cost=QUOTA_COST["search"])
 
         next_page_token = response.get("nextPageToken")
 
@@ -54,4 +167,40 @@ def fetch_video_details(video_id: str) -> Dict:
     request = youtube.videos().list(
         part="snippet,contentDetails,statistics,topicDetails", id=video_id
     )
-    return request.execute()
+    return _execute(request, quota_cost=QUOTA_COST["videos"])
+
+
+def fetch_video_details_bulk(
+    video_ids: List[str], max_per_request: int = MAX_IDS_PER_REQUEST
+) -> Dict:
+    """Return video details for multiple video ids using batched requests
+
+    Items of all the batches are merged into a single response. Ids which could
+    not be fetched are reported under `failures` along with the reason
+    """
+    youtube = _get_youtube_client()
+
+    max_per_request = min(max_per_request, MAX_IDS_PER_REQUEST)
+
+    items, failures = [], {}
+    for start in range(0, len(video_ids), max_per_request):
+        chunk = video_ids[start : start + max_per_request]
+        request = youtube.videos().list(
+            part="snippet,contentDetails,statistics,topicDetails", id=",".join(chunk)
+        )
+        try:
+            response = _execute(request, quota_cost=QUOTA_COST["videos"])
+        except (HttpError, *TRANSPORT_ERRORS) as e:
+            failures.update({video_id: str(e) or repr(e) for video_id in chunk})
+            continue
+
+        fetched = response.get("items", [])
+        items.extend(fetched)
+
+        # Deleted or private videos are silently dropped by the API
+        fetched_ids = {item.get("id") for item in fetched}
+        failures.update(
+            {video_id: NOT_FOUND for video_id in chunk if video_id not in fetched_ids}
+        )
+
+    return {"kind": "youtube#videoListResponse", "items": items, "failures": failures}
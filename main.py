@@ -1,21 +1,182 @@
+import os
+import sys
+from datetime import date
+from typing import List, Optional
+
 import click
+from click.core import ParameterSource
 from rich.console import Console
-from rich.markdown import Markdown
 
-from core.analyze import categorize_videos, cleanup_video_data
-from core.facade import export_metric
-from core.io import DataType, add_delete_marker, dump, loads
-from core.youtube_api import fetch_video_details, search
+# Modules depending on pandas, pyarrow, scikit-learn or Google API client are
+# imported by commands using them, so that startup of other commands is fast
+from core import instrument
+from core.constants import (
+    BUFFER_ROWS,
+    COMPRESSION,
+    EXPORT_FORMATS,
+    MAX_FEATURES,
+    MIN_DF,
+    N_CLUSTERS,
+    ROW_GROUP_SIZE,
+    TARGET_FILE_SIZE,
+    DataType,
+    Table,
+)
 
 console = Console()
 
+max_features_option = click.option(
+    "--max-features",
+    default=MAX_FEATURES,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of uni/bi-grams of tags used to categorize videos",
+)
+
+min_df_option = click.option(
+    "--min-df",
+    default=MIN_DF,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Ignore uni/bi-grams which appear in fewer tags while categorizing videos",
+)
+
+
+def _validate_n_clusters(ctx, param, value):
+    if value == "auto":
+        return value
+    try:
+        n_clusters = int(value)
+    except ValueError:
+        raise click.BadParameter("must be 'auto' or an integer")
+    if n_clusters < 2:
+        raise click.BadParameter("must be at least 2")
+    return n_clusters
+
+
+n_clusters_option = click.option(
+    "--n-clusters",
+    default=str(N_CLUSTERS),
+    show_default=True,
+    callback=_validate_n_clusters,
+    help="Number of categories of videos, 'auto' selects it using silhouette score",
+)
+
+# Metric commands along with metrics exported by each of them, name of the exported
+# file, which defaults to the name of the last metric, whether they report top or
+# bottom k tags and their help. Commands of `metrics` and stages of `run` are
+# created from it
+METRIC_EXPORTS = {
+    "videos-per-tag": (
+        ["videos_per_tag"],
+        None,
+        False,
+        "Compute Tags Vs number of videos",
+    ),
+    "tag-with-most-videos": (
+        ["tag_with_most_videos"],
+        None,
+        True,
+        "Compute Tag with most videos",
+    ),
+    "tag-with-least-videos": (
+        ["tag_with_least_videos"],
+        None,
+        True,
+        "Compute Tag with least videos",
+    ),
+    "most-video-time-tag": (
+        ["most_video_time_tag"],
+        None,
+        True,
+        "Compute Tag with most video time",
+    ),
+    "least-video-time-tag": (
+        ["least_video_time_tag"],
+        None,
+        True,
+        "Compute Tag with least video time",
+    ),
+    "avg-video-duration-per-tag": (
+        ["avg_video_duration_per_tag"],
+        None,
+        False,
+        "Compute Tag vs Avg duration of videos",
+    ),
+    "engagement-per-tag": (
+        ["engagement_per_tag"],
+        None,
+        False,
+        "Compute engagement metrics per tag",
+    ),
+    "classify-videos": (
+        [
+            "videos_per_category",
+            "category_with_most_videos",
+            "category_with_least_videos",
+            "avg_video_duration_per_category",
+            "most_video_time_category",
+            "least_video_time_category",
+        ],
+        "classify_videos_metrics",
+        True,
+        "Groups tags into fixed categories and compute metrics",
+    ),
+}
+
+k_option = click.option(
+    "--k",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of tags to report (per category) for top/bottom metrics",
+)
+
+
+class _RunCommand(click.Command):
+    """Command which is logged as a run, once its arguments are parsed
+
+    Help, usage errors and shell completion never invoke the command, hence they
+    are not logged
+    """
 
-@click.group()
+    def invoke(self, ctx):
+        root = ctx.find_root()
+        instrument.start_run(
+            command=" ".join(sys.argv[1:]),
+            path=root.params["run_log"],
+            profile=root.params["profile"],
+        )
+        root.call_on_close(instrument.end_run)
+        return super().invoke(ctx)
+
+
+class _RunGroup(click.Group):
+    command_class = _RunCommand
+    group_class = type
+
+
+@click.group(cls=_RunGroup)
 @click.option(
     "--no-title", default=False, is_flag=True, help="Do not print title in the terminal"
 )
-def cli(no_title):
+@click.option(
+    "--run-log",
+    default=os.path.join(instrument.RUN_LOG_DIR, "runs.jsonl"),
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    help="JSON lines file to which time, rows, bytes and memory of stages are appended",
+)
+@click.option(
+    "--profile",
+    default=False,
+    is_flag=True,
+    help="Profile the command using cProfile and dump stats next to the run log",
+)
+def cli(no_title, run_log, profile):
     if not no_title:
+        from rich.markdown import Markdown
+
         title = """
             Aviyel Data Assignment
         """
@@ -23,49 +184,225 @@ def cli(no_title):
 
 
 @cli.command()
-def raw():
+@click.option(
+    "--workers",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of threads fetching video details concurrently",
+)
+@click.option(
+    "--quota-per-second",
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Maximum API quota units spent per second. Unlimited by default",
+)
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Keep existing data, resume interrupted search and skip fetched videos",
+)
+@click.option(
+    "--raw-format",
+    type=click.Choice(["ndjson", "json"]),
+    default="ndjson",
+    show_default=True,
+    help="Store video details as newline delimited JSON or as JSON responses",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["none", "gzip", "zstd"]),
+    default="none",
+    show_default=True,
+    help="Compression of video details stored as newline delimited JSON",
+)
+def raw(workers, quota_per_second, incremental, raw_format, compression):
     """Fetches raw data using YouTube Data API"""
-
-    with console.status("[bold red] Truncate old data...") as _:
-        add_delete_marker(data_type=DataType.YOUTUBE_VIDEO)
-        add_delete_marker(data_type=DataType.YOUTUBE_SEARCH)
-        add_delete_marker(data_type=DataType.PREPROCESSED)
-        add_delete_marker(data_type=DataType.DATA_LAKE)
-
-    with console.status("[bold green]Fetching search results...") as _:
-        for data in search(keyword="python", max_results=500, max_per_request=50):
-            num_fetched = len(data["items"])
-
-            path = dump(data=data, data_type=DataType.YOUTUBE_SEARCH)
-
+    from core.fetcher import fetch_video_details_concurrently
+    from core.index import FetchIndex
+    from core.io import add_delete_marker, dump, dump_ndjson
+    from core.youtube_api import NOT_FOUND, configure, search
+
+    configure(quota_per_second=quota_per_second)
+
+    if not incremental:
+        with console.status("[bold red] Truncate old data...") as _:
+            add_delete_marker(data_type=DataType.YOUTUBE_VIDEO)
+            add_delete_marker(data_type=DataType.YOUTUBE_SEARCH)
+            add_delete_marker(data_type=DataType.PREPROCESSED)
+            add_delete_marker(data_type=DataType.DATA_LAKE)
+            add_delete_marker(data_type=DataType.FETCH_INDEX)
+
+    keyword, max_results = "python", 500
+
+    with console.status(
+        "[bold green]Fetching search results and video details..."
+    ) as _, FetchIndex() as index, instrument.stage("fetch"):
+        page_token, total_fetched = index.get_checkpoint(keyword)
+        if page_token:
+            console.log(f"Resuming search after {total_fetched} results")
+
+        search_pages = search(
+            keyword=keyword,
+            max_results=max_results - total_fetched,
+            max_per_request=50,
+            page_token=page_token,
+        )
+        for search_data, video_details in fetch_video_details_concurrently(
+            search_pages,
+            workers=workers,
+            video_ids_filter=index.filter_unseen if incremental else None,
+        ):
+            num_fetched = len(search_data["items"])
+            path = dump(data=search_data, data_type=DataType.YOUTUBE_SEARCH)
             console.log(f"Fetched {num_fetched} results and saved to {path}")
 
-    with console.status("[bold green]Fetching video details...") as _:
-        ref_search_data = loads(data_type=DataType.YOUTUBE_SEARCH)
-        for search_data in ref_search_data:
-            items = search_data.get("items", [])
-            video_data = []
-            for video in items:
-                video_id = video.get("id", {}).get("videoId")
-                video_details = fetch_video_details(video_id=video_id)
-                video_data.append(video_details)
-
-            path = dump(data=video_data, data_type=DataType.YOUTUBE_VIDEO)
-            console.log(f"Fetched video details and stored at {path}")
+            failures = video_details.pop("failures")
+            for video_id, reason in failures.items():
+                console.log(f"[red]Failed to fetch details of {video_id}: {reason}")
+            index.add_missing(
+                video_id for video_id, reason in failures.items() if reason == NOT_FOUND
+            )
+
+            if video_details["items"]:
+                if raw_format == "ndjson":
+                    path = dump_ndjson(
+                        video_details["items"],
+                        data_type=DataType.YOUTUBE_VIDEO,
+                        compression=None if compression == "none" else compression,
+                    )
+                else:
+                    path = dump(data=[video_details], data_type=DataType.YOUTUBE_VIDEO)
+                index.add(video_details["items"])
+                console.log(f"Fetched video details and stored at {path}")
+
+            # Checkpoint only after the page is stored, so that resume never skips it
+            total_fetched += num_fetched
+            next_page_token = search_data.get("nextPageToken")
+            if next_page_token:
+                index.set_checkpoint(keyword, next_page_token, total_fetched)
+
+        index.clear_checkpoint(keyword)
 
 
 @cli.command()
-def preprocess():
-    """Preprocess raw data and make them consumable for analysis"""
-    with console.status("[bold green] Preprocessing and cleaning up data..") as status:
-        ref_video_data = loads(data_type=DataType.YOUTUBE_VIDEO, as_dataframe=True)
-        for video_df in ref_video_data:
-            df = cleanup_video_data(video_df)
-            path = dump(data=df, data_type=DataType.PREPROCESSED)
-
-    with console.status("[bold green] Categorize videos using tags...") as _:
-        df = categorize_videos()
-        path = dump(data=df, data_type=DataType.DATA_LAKE)
+@max_features_option
+@min_df_option
+@n_clusters_option
+@click.option(
+    "--write-mode",
+    type=click.Choice(["chunk", "buffered"]),
+    default="chunk",
+    show_default=True,
+    help="Write each raw chunk to its own file or buffer chunks into larger files",
+)
+@click.option(
+    "--buffer-rows",
+    default=BUFFER_ROWS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of rows buffered before they are written in buffered write mode",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes preprocessing raw chunks in parallel",
+)
+@click.pass_context
+def preprocess(ctx, max_features, min_df, n_clusters, write_mode, buffer_rows, workers):
+    """Preprocess raw data and make them consumable for analysis
+
+    Videos are categorized using the persisted category model. It is trained on the
+    preprocessed data if it does not exist yet, hence --max-features, --min-df and
+    --n-clusters must match the persisted model. Use `retrain` to change them
+    """
+    from core.analyze import (
+        categorize_videos,
+        category_model_params,
+        cleanup_video_data,
+    )
+    from core.io import add_delete_marker, buffer_tables, dump, list_files, loads
+    from core.preprocessor import preprocess_concurrently
+
+    if write_mode == "buffered" and workers > 1:
+        raise click.UsageError("--workers can not be used with buffered write mode")
+
+    # Parameters passed explicitly would otherwise be ignored silently
+    requested = {
+        name: value
+        for name, value in [
+            ("max_features", max_features),
+            ("min_df", min_df),
+            ("n_clusters", n_clusters),
+        ]
+        if ctx.get_parameter_source(name) == ParameterSource.COMMANDLINE
+    }
+    params = category_model_params() if requested else None
+    if params:
+        mismatched = [
+            f"--{name.replace('_', '-')}={params[name]}"
+            for name, value in requested.items()
+            if name in params and params[name] != value
+        ]
+        if mismatched:
+            raise click.UsageError(
+                f"Category model was trained with {', '.join(mismatched)}, "
+                "use `retrain` to train it with other parameters"
+            )
+
+    # Incremental `raw` stores no chunk when there are no new videos, hence the data
+    # lake is kept as is
+    paths = list_files(DataType.YOUTUBE_VIDEO)
+    if not paths:
+        console.log("No raw data to preprocess")
+        add_delete_marker(data_type=DataType.YOUTUBE_SEARCH)
+        return
+
+    if write_mode == "buffered":
+        with console.status(
+            "[bold green] Preprocessing and cleaning up data.."
+        ), instrument.stage("cleanup"):
+            ref_video_data = loads(data_type=DataType.YOUTUBE_VIDEO, as_dataframe=True)
+            chunks = (cleanup_video_data(video_df) for video_df in ref_video_data)
+            for tables in buffer_tables(chunks, max_rows=buffer_rows):
+                dump(data=tables, data_type=DataType.PREPROCESSED)
+    else:
+        # All the chunks of a run are stamped with the same ingestion date
+        ingest_date = date.today().isoformat()
+
+        failures = {}
+        with console.status(
+            "[bold green] Preprocessing and cleaning up data.."
+        ) as status, instrument.stage("cleanup"):
+            results = preprocess_concurrently(
+                paths, workers=workers, ingest_date=ingest_date
+            )
+            for done, (path, error) in enumerate(results, start=1):
+                if error:
+                    failures[path] = error
+                    console.log(f"[red]Failed to preprocess {path}: {error!r}")
+                status.update(
+                    f"[bold green] Preprocessed {done}/{len(paths)} chunks "
+                    f"({len(failures)} failed).."
+                )
+
+        # Raw data is kept, so that failed chunks can be preprocessed again
+        if failures:
+            raise click.ClickException(
+                f"Failed to preprocess {len(failures)} of {len(paths)} chunks"
+            )
+        console.log(f"Preprocessed {len(paths)} chunks using {workers} workers")
+
+    with console.status(
+        "[bold green] Categorize videos using tags..."
+    ) as _, instrument.stage("categorize"):
+        tables = categorize_videos(
+            max_features=max_features, min_df=min_df, n_clusters=n_clusters
+        )
+        path = dump(data=tables, data_type=DataType.DATA_LAKE)
 
     console.log(f"Stored preprocessed data at {path}")
 
@@ -75,79 +412,253 @@ def preprocess():
         add_delete_marker(data_type=DataType.PREPROCESSED)
 
 
-@cli.group()
-def metrics():
-    """Compute specified metrics using preprocessed data"""
-    pass
-
-
-@metrics.command()
-def videos_per_tag():
-    """Compute Tags Vs number of videos"""
-    path = export_metric(metrics=["videos_per_tag"])
-    console.log(f"Exported to {path}")
-
-
-@metrics.command()
-def tag_with_most_videos():
-    """Compute Tag with most videos"""
-    path = export_metric(metrics=["tag_with_most_videos"])
-    console.log(f"Exported to {path}")
-
-
-@metrics.command()
-def tag_with_least_videos():
-    """Compute Tag with least videos"""
-    path = export_metric(metrics=["tag_with_least_videos"])
-    console.log(f"Exported to {path}")
-
+@cli.command()
+@max_features_option
+@min_df_option
+@n_clusters_option
+def retrain(max_features, min_df, n_clusters):
+    """Retrain category model on the data lake and reassign categories"""
+    from core.analyze import recategorize_videos
+    from core.io import overwrite_table
+
+    with console.status(
+        "[bold green] Retrain model and categorize videos..."
+    ) as _, instrument.stage("retrain"):
+        tables = recategorize_videos(
+            max_features=max_features, min_df=min_df, n_clusters=n_clusters
+        )
+        for table, reader in tables.items():
+            path = overwrite_table(reader, data_type=DataType.DATA_LAKE, table=table)
+            console.log(f"Stored recategorized {table.value} at {path}")
 
-@metrics.command()
-def avg_video_duration_per_tag():
-    """Compute Tag vs Avg duration of videos"""
-    path = export_metric(metrics=["avg_video_duration_per_tag"])
-    console.log(f"Exported to {path}")
 
+@cli.command()
+@click.option(
+    "--target-file-size",
+    default=TARGET_FILE_SIZE // (1024 * 1024),
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Size of compacted files in MBs",
+)
+@click.option(
+    "--row-group-size",
+    default=ROW_GROUP_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of rows in each row group of compacted files",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["zstd", "snappy", "gzip", "brotli", "lz4", "none"]),
+    default=COMPRESSION,
+    show_default=True,
+    help="Compression codec of compacted files",
+)
+def compact(target_file_size, row_group_size, compression):
+    """Merge small files of the data lake into larger sorted files"""
+    from core.io import compact_table
+
+    for table in Table:
+        with console.status(
+            f"[bold green] Compacting {table.value}..."
+        ) as _, instrument.stage(f"compact.{table.value}"):
+            path = compact_table(
+                DataType.DATA_LAKE,
+                table,
+                target_file_size=target_file_size * 1024 * 1024,
+                row_group_size=row_group_size,
+                compression=compression,
+            )
+        console.log(f"Compacted {path}")
 
-@metrics.command()
-def most_video_time_tag():
-    """Compute Tag with most video time"""
-    path = export_metric(metrics=["most_video_time_tag"])
-    console.log(f"Exported to {path}")
 
+@cli.group()
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Recompute metrics even if they are cached for the current data",
+)
+@click.option(
+    "--category",
+    "categories",
+    multiple=True,
+    help="Compute metrics only for videos of the category, can be repeated",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Compute metrics only for videos ingested on or after the date",
+)
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default="xlsx",
+    show_default=True,
+    help="Format of exported metrics, arrow files can be memory mapped",
+)
+@click.pass_context
+def metrics(ctx, no_cache, categories, since, export_format):
+    """Compute specified metrics using preprocessed data
+
+    Metrics can be restricted to categories or recently ingested videos, in which
+    case only matching partitions of the data lake are read
+    """
+    filters = []
+    if categories:
+        filters.append(("category", "in", list(categories)))
+    if since:
+        filters.append(("ingestDate", ">=", since.date().isoformat()))
+
+    # Options passed to export of every metric
+    ctx.obj = {
+        "use_cache": not no_cache,
+        "filters": filters or None,
+        "export_format": export_format,
+    }
+
+
+def _export_metric(metrics: List[str], use_cache: bool = True, **kwargs) -> str:
+    from core.cache import configure as configure_cache
+    from core.facade import export_metric
+
+    configure_cache(enabled=use_cache)
+    return export_metric(metrics=metrics, **kwargs)
+
+
+def _add_metric_command(
+    name: str,
+    metric_names: List[str],
+    file_name: Optional[str],
+    top_k: bool,
+    command_help: str,
+):
+    """Add command exporting the metrics to the `metrics` group"""
+
+    @click.pass_obj
+    def _command(options, **kwargs):
+        with console.status(f"[bold green]Compute {name}...") as _:
+            path = _export_metric(
+                metrics=metric_names, file_name=file_name, **kwargs, **options
+            )
+        console.log(f"Exported to {path}")
+
+    if top_k:
+        _command = k_option(_command)
+    metrics.command(name=name, help=command_help)(_command)
+
+
+for command_name, command_options in METRIC_EXPORTS.items():
+    _add_metric_command(command_name, *command_options)
+
+
+@metrics.command(name="all")
+@k_option
+@click.pass_obj
+def all_metrics(options, k):
+    """Compute every metric using a single scan of the data"""
+    from core.analyze import METRICS
+
+    with console.status("[bold green]Compute all metrics...") as _:
+        path = _export_metric(
+            metrics=list(METRICS), file_name="all_metrics", k=k, **options
+        )
 
-@metrics.command()
-def least_video_time_tag():
-    """Compute Tag with least video time"""
-    path = export_metric(metrics=["least_video_time_tag"])
     console.log(f"Exported to {path}")
 
 
-@metrics.command()
-def classify_videos():
-    """Groups tags into fixed categories and compute metrics"""
-
-    with console.status("[bold green]Compute metrics on categories...") as _:
-        path = export_metric(
-            metrics=[
-                "videos_per_category",
-                "category_with_most_videos",
-                "category_with_least_videos",
-                "avg_video_duration_per_category",
-                "most_video_time_category",
-                "least_video_time_category",
-            ],
-            file_name="classify_videos_metrics",
+@cli.command()
+@click.argument("targets", nargs=-1, type=click.Choice(list(METRIC_EXPORTS)))
+@click.option(
+    "--workers",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of threads running independent stages concurrently",
+)
+@click.option(
+    "--fetch/--no-fetch",
+    default=True,
+    show_default=True,
+    help="Fetch raw data, otherwise only raw data fetched earlier is preprocessed",
+)
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Keep existing data and fetch only new videos, see `raw --incremental`",
+)
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="Run stages even if their inputs did not change since their last run",
+)
+@k_option
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default="xlsx",
+    show_default=True,
+    help="Format of exported metrics",
+)
+@click.pass_context
+def run(ctx, targets, workers, fetch, incremental, force, k, export_format):
+    """Run raw, preprocess and metrics stages in a single process
+
+    Metric stages run concurrently on a single load of the data lake. Stages whose
+    inputs and outputs did not change since their last successful run are skipped.
+    All metrics are exported unless TARGETS i.e names of metric commands are passed.
+    Without --incremental, every run fetches and preprocesses all the data again
+    """
+    from core.io import list_files
+    from core.pipeline import (
+        Node,
+        critical_path,
+        files_fingerprint,
+        metric_nodes,
+        run_graph,
+    )
+
+    nodes = []
+    if fetch:
+        nodes.append(Node("raw", lambda _: ctx.invoke(raw, incremental=incremental)))
+    nodes.append(
+        Node(
+            "preprocess",
+            lambda _: ctx.invoke(preprocess, n_clusters=N_CLUSTERS),
+            deps=["raw"] if fetch else [],
+            fingerprint=lambda: files_fingerprint(list_files(DataType.YOUTUBE_VIDEO)),
         )
+    )
+    exports = {
+        target: METRIC_EXPORTS[target][:2] for target in targets or METRIC_EXPORTS
+    }
+    nodes.extend(
+        metric_nodes(exports, deps=["preprocess"], k=k, export_format=export_format)
+    )
+
+    report = run_graph(nodes, workers=workers, force=force)
+
+    for name, result in report.items():
+        elapsed = (
+            f"{result['finished'] - result['started']:.2f}s"
+            if "finished" in result
+            else ""
+        )
+        console.log(f"{name:<40} {result['status']:<10} {elapsed}")
+        if result.get("error"):
+            console.log(f"[red]{name} failed: {result['error']!r}")
 
-    console.log(f"Exported to {path}")
-
+    path, total = critical_path(nodes, report)
+    if path:
+        console.log(f"Critical path ({total:.2f}s): {' -> '.join(path)}")
 
-@metrics.command()
-def engagement_per_tag():
-    """Compute engagement metrics per tag"""
-    path = export_metric(metrics=["engagement_per_tag"])
-    console.log(f"Exported to {path}")
+    failed = [name for name, result in report.items() if result["status"] == "failed"]
+    if failed:
+        raise click.ClickException(f"Failed to run {', '.join(failed)}")
 
 
 if __name__ == "__main__":
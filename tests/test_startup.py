@@ -0,0 +1,62 @@
+"""Startup time of CLI commands is kept within budgets of `benchmarks.bench_startup`
+
+Budgets can be scaled on slower machines using `STARTUP_BUDGET_SCALE`
+"""
+
+import os
+
+import pytest
+
+from benchmarks.bench_startup import COMMANDS, check, command_modules, main_commands
+
+REPEAT = 3
+SCALE = float(os.environ.get("STARTUP_BUDGET_SCALE", 1))
+
+
+def test_every_command_has_budget():
+    assert sorted(main_commands()) == sorted(COMMANDS)
+
+
+@pytest.mark.parametrize("command", list(COMMANDS))
+def test_command_startup(command):
+    result = check(command, main_commands()[command], repeat=REPEAT, scale=SCALE)
+    assert result["status"] == "ok", (
+        f"{command} took {result['elapsed']:.1f}ms of {result['budget']:.0f}ms budget "
+        f"and {result['status']}"
+    )
+
+
+def test_command_modules_follow_calls():
+    source = """
+import click
+
+@click.group()
+def cli():
+    from rich.markdown import Markdown
+
+def _helper():
+    import core.facade
+
+@cli.command()
+def first():
+    from core.io import dump
+    _helper()
+
+@cli.group()
+def nested():
+    pass
+
+@nested.command(name="inner-command")
+def inner():
+    import core.cache
+
+def _add_command(name):
+    def _generated():
+        import core.pipeline
+
+    nested.command(name=name)(_generated)
+"""
+    assert command_modules(source) == {
+        "first": ["core.facade", "core.io", "rich.markdown"],
+        "nested": ["core.cache", "core.pipeline", "rich.markdown"],
+    }